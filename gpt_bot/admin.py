@@ -1,5 +1,13 @@
-from django.contrib import admin
+import logging
+
+from django.contrib import admin, messages
+from django.utils.html import format_html
+from telegram.error import TelegramError
+
 from . import models
+from .bot.delivery import get_standalone_delivery
+
+logger = logging.getLogger(__name__)
 
 
 @admin.register(models.TelegramUser)
@@ -15,8 +23,34 @@ class QuestionInline(admin.StackedInline):
     
 @admin.register(models.FlowProcess)
 class FlowProcessAdmin(admin.ModelAdmin):
-    list_display = ("id", "full_name")
+    list_display = ("id", "full_name", "cv_link")
+    readonly_fields = ("cv_link",)
     inlines = [QuestionInline]
+    actions = ["resend_resume"]
+
+    @admin.display(description="CV")
+    def cv_link(self, process):
+        # copied CVs are in the media storage, older rows only have the Telegram url
+        url = process.cv_file.url if process.cv_file else process.cv
+        return format_html('<a href="{}">CV</a>', url) if url else "-"
+
+    @admin.action(description="Resend the resume to the candidate")
+    def resend_resume(self, request, queryset):
+        delivery = get_standalone_delivery()
+        sent, failed = 0, 0
+        for process in queryset.exclude(generated_resume="").exclude(generated_resume__isnull=True):
+            # e.g. a candidate who blocked the bot, the rest of the selection is still sent
+            try:
+                delivery.send(process.telegram_user_id, process)
+            except (TelegramError, OSError) as e:
+                logger.warning("resending the resume of process %s failed: %r", process.id, e)
+                failed += 1
+            else:
+                sent += 1
+        if failed:
+            self.message_user(request, f"Sent {sent} resumes, {failed} failed", level=messages.WARNING)
+        else:
+            self.message_user(request, f"Sent {sent} resumes")
     
 
 @admin.register(models.Specialization)
@@ -29,6 +63,18 @@ class RegionAdmin(admin.ModelAdmin):
     list_display = ("id", "name")
     
     
+@admin.register(models.QuestionBankEntry)
+class QuestionBankEntryAdmin(admin.ModelAdmin):
+    list_display = ("id", "question_type", "specialization_key", "used", "created_at", "last_used_at")
+    list_filter = ("question_type",)
+
+
+@admin.register(models.ResumeJob)
+class ResumeJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "process", "status", "attempts", "created_at", "updated_at")
+    list_filter = ("status",)
+
+
 @admin.register(models.UserLimit)
 class UserLimitAdmin(admin.ModelAdmin):
     list_display = ("id", "phone_number", "limit", "used")
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class GptBotConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "gpt_bot"
+
+    def ready(self):
+        from gpt_bot import signals  # noqa: F401
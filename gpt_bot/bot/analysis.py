@@ -0,0 +1,205 @@
+import asyncio
+import json
+import logging
+import time
+
+from django.conf import settings
+
+from gpt_bot.models import FlowProcess, Question
+from .llm import llm
+from .prompts import router
+
+logger = logging.getLogger(__name__)
+
+_semaphore = None
+
+
+class AnalysisFailed(Exception):
+    pass
+
+
+def format_answers(questions) -> str:
+    return "\n".join(["%s\nОтвет: %s" % (q.question, q.answer) for q in questions])
+
+
+def parse_int(st):
+    try:
+        return int("".join([c for c in st if c.isdigit()]))
+    except (TypeError, ValueError):
+        return 0
+
+
+def strip_answer(st):
+    st = st.strip()
+    if st.startswith("Ответ:"):
+        st = st[len("Ответ:"):]
+    return st
+
+
+def get_transcripts(process_id) -> dict:
+    questions = Question.objects.filter(process_id=process_id).order_by("index")
+    return {
+        question_type: format_answers([q for q in questions if q.question_type == question_type])
+        for question_type in ("iq_test", "soft_skill", "professional_test")
+    }
+
+
+def get_analysis_prompts(transcripts) -> dict:
+    """Map of FlowProcess field -> (prompt, parser) for every analysis result; fields double as profile names."""
+    iq_tests = transcripts["iq_test"]
+    soft_skill_tests = transcripts["soft_skill"]
+    tech_tests = transcripts["professional_test"]
+    return {
+        "iq_test_score": (
+            iq_tests +
+            "\n\nосноваясь выщеуказанным ответам дай суммарный балл по шкале 1 - 250 для "
+            "определения IQ интеллект и верни только цифру.",
+            parse_int,
+        ),
+        "soft_skill_main_result": (
+            soft_skill_tests +
+            "\n\nПроанализируй ответы кандидата на вопросы по софт-скиллам и верни результат в виде текста.",
+            strip_answer,
+        ),
+        "soft_skill_recommendation": (
+            soft_skill_tests +
+            "\n\nПроанализируй ответы кандидата на вопросы по софт-скиллам и рекомендации по улучшению.",
+            strip_answer,
+        ),
+        "professional_test_main_result": (
+            tech_tests +
+            "\n\nПроанализируй ответы кандидата на вопросы по техническим навыкам и верни результат в виде текста.",
+            strip_answer,
+        ),
+        "professional_test_recommendation": (
+            tech_tests +
+            "\n\nПроанализируй ответы кандидата на вопросы по техническим навыкам и рекомендации по улучшению.",
+            strip_answer,
+        ),
+    }
+
+
+STRUCTURED_TEXT_FIELDS = (
+    "soft_skill_main_result",
+    "soft_skill_recommendation",
+    "professional_test_main_result",
+    "professional_test_recommendation",
+)
+
+
+def get_structured_prompt(transcripts) -> str:
+    return (
+        "Тест IQ:\n" + transcripts["iq_test"] +
+        "\n\nВопросы по софт-скиллам:\n" + transcripts["soft_skill"] +
+        "\n\nВопросы по техническим навыкам:\n" + transcripts["professional_test"] +
+        "\n\nПроанализируй ответы кандидата и верни только JSON-объект без пояснений с ключами:\n"
+        "\"iq_test_score\" - суммарный балл IQ по шкале 1 - 250, целое число;\n"
+        "\"soft_skill_main_result\" - результат анализа ответов по софт-скиллам в виде текста;\n"
+        "\"soft_skill_recommendation\" - рекомендации по улучшению софт-скиллов;\n"
+        "\"professional_test_main_result\" - результат анализа ответов по техническим навыкам в виде текста;\n"
+        "\"professional_test_recommendation\" - рекомендации по улучшению технических навыков."
+    )
+
+
+def parse_structured_result(text) -> dict:
+    """Extract and validate the JSON object; raises ValueError on anything unexpected."""
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("no JSON object in structured analysis response")
+    data = json.loads(text[start:end + 1])
+    if not isinstance(data, dict):
+        raise ValueError("structured analysis response is not an object")
+    result = {}
+    score = data.get("iq_test_score")
+    if isinstance(score, str) and score.strip().isdigit():
+        score = int(score)
+    if isinstance(score, bool) or not isinstance(score, int) or not 1 <= score <= 250:
+        raise ValueError(f"invalid iq_test_score: {score!r}")
+    result["iq_test_score"] = score
+    for field in STRUCTURED_TEXT_FIELDS:
+        value = data.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f"invalid {field}: {value!r}")
+        result[field] = value.strip()
+    return result
+
+
+def get_semaphore() -> asyncio.Semaphore:
+    # created lazily so it is bound to the LLM client loop
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.LLM_ANALYSIS_CONCURRENCY)
+    return _semaphore
+
+
+async def run_prompt(field, prompt, parser):
+    async with get_semaphore():
+        started = time.monotonic()
+        try:
+            text = await router.acomplete(field, prompt)
+        except Exception as e:
+            logger.exception("analysis prompt %s failed", field)
+            return None, {"seconds": round(time.monotonic() - started, 3), "error": repr(e)}
+    return parser(text), {"seconds": round(time.monotonic() - started, 3)}
+
+
+async def run_prompts(prompts: dict):
+    """
+    Run every prompt concurrently; a failed prompt leaves its field as None. Raises ``AnalysisFailed``
+    when every prompt failed, e.g. while the circuit breaker is open, so nothing is stored and rendered.
+    """
+    started = time.monotonic()
+    fields = list(prompts)
+    outcomes = await asyncio.gather(*[run_prompt(field, *prompts[field]) for field in fields])
+    results, timings = {}, {}
+    for field, (value, timing) in zip(fields, outcomes):
+        if value is not None:
+            results[field] = value
+        timings[field] = timing
+    timings["total"] = {"seconds": round(time.monotonic() - started, 3)}
+    if not results:
+        raise AnalysisFailed(timings)
+    return results, timings
+
+
+async def run_structured(transcripts):
+    """One request for every field, falling back to the per-field prompts when validation fails."""
+    started = time.monotonic()
+    try:
+        # validated before caching, an invalid response would otherwise be served again
+        text = await router.acomplete(
+            "structured_analysis", get_structured_prompt(transcripts), validate=parse_structured_result
+        )
+        results = parse_structured_result(text)
+    except Exception as e:
+        logger.warning("structured analysis failed, falling back to per-field prompts: %r", e)
+        structured_timing = {"seconds": round(time.monotonic() - started, 3), "error": repr(e)}
+        results, timings = await run_prompts(get_analysis_prompts(transcripts))
+        timings["structured"] = structured_timing
+        return results, timings
+    seconds = round(time.monotonic() - started, 3)
+    return results, {"structured": {"seconds": seconds}, "total": {"seconds": seconds}}
+
+
+async def aanalyze_answers(process_id):
+    """Run the analysis prompts on the client loop and store the results on the FlowProcess."""
+    loop = asyncio.get_running_loop()
+    transcripts = await loop.run_in_executor(None, get_transcripts, process_id)
+    if settings.LLM_ANALYSIS_MODE == "structured":
+        results, timings = await run_structured(transcripts)
+    else:
+        results, timings = await run_prompts(get_analysis_prompts(transcripts))
+    await loop.run_in_executor(
+        None, lambda: FlowProcess.objects.filter(id=process_id).update(analysis_timings=timings, **results)
+    )
+
+
+def analyze_answers(process_id):
+    llm.run(aanalyze_answers(process_id))
+
+
+def analize_user_answers(process_id):
+    analyze_answers(process_id)
+    process = FlowProcess.objects.get(id=process_id)
+    process.generate_resume()
+    return process
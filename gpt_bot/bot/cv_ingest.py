@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from urllib.parse import urlparse
+
+import aiohttp
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from telegram.error import TelegramError
+
+from gpt_bot.models import FlowProcess
+from .llm import llm
+
+logger = logging.getLogger(__name__)
+
+
+class CVTooLarge(Exception):
+    pass
+
+
+class TelegramFileSource:
+    """Bot API files: ``getFile`` for the path, then a streamed GET from the file server of the bot."""
+
+    def __init__(self, bot, timeout=60):
+        self.bot = bot
+        self.timeout = timeout
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def open(self, file_id, max_size, chunk_size):
+        """Return the file name and an async iterator of its chunks."""
+        file = await asyncio.get_running_loop().run_in_executor(None, self.bot.get_file, file_id)
+        if file.file_size and file.file_size > max_size:
+            raise CVTooLarge(f"{file.file_size} bytes")
+        return os.path.basename(file.file_path), self._read(file.file_path, chunk_size)
+
+    async def _read(self, url, chunk_size):
+        async with self._get_session().get(url) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(chunk_size):
+                yield chunk
+
+    async def aclose(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+class LocalFileSource:
+    """Stand-in for tests: the file id is the name of a file in ``root``."""
+
+    def __init__(self, root):
+        self.root = root
+
+    async def open(self, file_id, max_size, chunk_size):
+        path = os.path.join(self.root, os.path.basename(file_id))
+        if os.path.getsize(path) > max_size:
+            raise CVTooLarge(f"{os.path.getsize(path)} bytes")
+        return os.path.basename(path), self._read(path, chunk_size)
+
+    @staticmethod
+    async def _read(path, chunk_size):
+        loop = asyncio.get_running_loop()
+        with open(path, "rb") as f:
+            while True:
+                chunk = await loop.run_in_executor(None, f.read, chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    async def aclose(self):
+        pass
+
+
+def get_file_source(bot, url=None):
+    url = url or settings.CV_SOURCE_URL
+    parsed = urlparse(url)
+    if parsed.scheme == "telegram":
+        return TelegramFileSource(bot)
+    if parsed.scheme == "file":
+        return LocalFileSource(parsed.path)
+    raise ValueError(f"unsupported cv source url: {url}")
+
+
+class CVIngestor:
+    """
+    Copies candidates' CVs to the media storage in the background. The FlowProcess row has the Telegram
+    file id from the start; the storage path and sha256 are filled in once the copy is done, or
+    ``cv_error`` when it was given up.
+    """
+
+    def __init__(self, source, max_size=20 * 1024 * 1024, chunk_size=64 * 1024, concurrency=4, retries=3):
+        self.source = source
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.retries = retries
+        self._semaphore = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # created on the client loop, where every ingestion runs
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    def submit(self, process_id, file_id):
+        future = llm.submit(self.ingest(process_id, file_id))
+        future.add_done_callback(lambda f: self._report(process_id, f))
+        return future
+
+    @staticmethod
+    def _report(process_id, future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning("cv of process %s failed: %r", process_id, future.exception())
+
+    def close(self):
+        llm.run(self.source.aclose())
+
+    def recover(self):
+        """Start the copies a previous bot process did not finish."""
+        pending = FlowProcess.objects.filter(
+            cv_file_id__isnull=False, cv_sha256__isnull=True, cv_error__isnull=True
+        ).values_list("id", "cv_file_id")
+        for process_id, file_id in pending:
+            self.submit(process_id, file_id)
+
+    async def ingest(self, process_id, file_id) -> dict:
+        async with self.semaphore:
+            fields = await self.copy(file_id)
+        await asyncio.get_running_loop().run_in_executor(
+            None, lambda: FlowProcess.objects.filter(id=process_id).update(**fields)
+        )
+        return fields
+
+    async def copy(self, file_id) -> dict:
+        """The FlowProcess fields to set: storage path and checksum, or the error the copy was given up with."""
+        for attempt in range(1, self.retries + 1):
+            try:
+                path, sha256 = await self.download(file_id)
+                return {"cv_file": path, "cv_sha256": sha256}
+            except CVTooLarge as e:
+                return {"cv_error": f"larger than {self.max_size} bytes: {e}"}
+            except (aiohttp.ClientError, asyncio.TimeoutError, TelegramError, OSError) as e:
+                if attempt == self.retries:
+                    return {"cv_error": repr(e)}
+                logger.warning("cv %s download failed (%r), retry %s", file_id, e, attempt + 1)
+                await asyncio.sleep(2 ** attempt)
+
+    async def download(self, file_id):
+        """Stream the file through a temporary file into the storage, named by its checksum."""
+        name, chunks = await self.source.open(file_id, self.max_size, self.chunk_size)
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.TemporaryFile() as tmp:
+            try:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_size:
+                        raise CVTooLarge(f"over {size} bytes")
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            finally:
+                await chunks.aclose()
+            tmp.seek(0)
+            sha256 = digest.hexdigest()
+            path = f"media/cv/{sha256}{os.path.splitext(name)[1].lower()}"
+            path = await asyncio.get_running_loop().run_in_executor(None, self.store, path, tmp)
+        return path, sha256
+
+    @staticmethod
+    def store(path, file) -> str:
+        # content addressed, the same CV sent again is stored once
+        if default_storage.exists(path):
+            return path
+        saved = default_storage.save(path, File(file))
+        if saved != path:
+            # another process stored the same CV in between and the storage picked a free name, keep theirs
+            default_storage.delete(saved)
+        return path
@@ -0,0 +1,50 @@
+import logging
+
+from django.conf import settings
+from telegram import Bot, InputFile
+from telegram.error import BadRequest
+
+from gpt_bot.models import FlowProcess
+
+logger = logging.getLogger(__name__)
+
+RESUME_CAPTION = "📄Ваше резюме готово!"
+
+
+class ResumeDelivery:
+    """
+    Sends resume PDFs. The first send uploads the file from storage and keeps the Telegram file id on the
+    FlowProcess; later sends reuse it, and upload again only if Telegram rejects the id.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    def send(self, chat_id, process: FlowProcess, caption=RESUME_CAPTION):
+        if process.resume_file_id:
+            try:
+                return self.bot.send_document(chat_id, document=process.resume_file_id, caption=caption)
+            except BadRequest as e:
+                logger.info("resume file id of process %s rejected (%s), uploading again", process.id, e)
+        return self.upload(chat_id, process, caption)
+
+    def upload(self, chat_id, process: FlowProcess, caption=RESUME_CAPTION):
+        with process.generated_resume.open("rb") as document:
+            message = self.bot.send_document(
+                chat_id, document=InputFile(document, filename=f"resume_{process.id}.pdf"), caption=caption
+            )
+        process.resume_file_id = message.document.file_id
+        # only if the resume was not rendered again meanwhile
+        FlowProcess.objects.filter(id=process.id, generated_resume=process.generated_resume.name).update(
+            resume_file_id=process.resume_file_id
+        )
+        return message
+
+
+def get_standalone_delivery() -> ResumeDelivery:
+    """Delivery through a bare Bot, for processes that do not run the bot, e.g. the admin."""
+    return ResumeDelivery(Bot(
+        settings.BOT_TOKEN,
+        base_url=f"{settings.TELEGRAM_API_URL}/bot",
+        base_file_url=f"{settings.TELEGRAM_API_URL}/file/bot",
+    ))
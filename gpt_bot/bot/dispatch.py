@@ -0,0 +1,156 @@
+import functools
+import logging
+import threading
+from collections import deque
+
+from django.db import close_old_connections
+from telegram.error import TelegramError
+from telegram.ext import Dispatcher
+
+from gpt_bot import metrics
+from .sharding import get_chat_id
+
+logger = logging.getLogger(__name__)
+
+
+class ChatScheduler:
+    """
+    Runs tasks on a fixed pool of threads, concurrently across chats and strictly in submit order within a chat.
+
+    A chat is in flight while it has queued or running tasks. Submitting for a new chat blocks while
+    ``max_chats`` chats are in flight, which pushes back on the update source; a chat that already has
+    ``max_pending`` tasks queued gets its new ones dropped, so one flooding chat can not stall the others.
+    """
+
+    def __init__(self, workers=8, max_chats=64, max_pending=20):
+        self.workers = workers
+        self.max_chats = max_chats
+        self.max_pending = max_pending
+        self.queues = {}  # chat id -> deque of tasks, present while the chat is in flight
+        self.ready = deque()  # in flight chats that are not running and have a task queued
+        self.running = set()
+        self.dropped = 0
+        self._threads = []
+        self._stopping = False
+        self._condition = threading.Condition()
+
+    @property
+    def queued(self) -> int:
+        with self._condition:
+            return sum(len(tasks) for tasks in self.queues.values())
+
+    @property
+    def in_flight(self) -> int:
+        return len(self.queues)
+
+    def start(self):
+        with self._condition:
+            if self._threads:
+                return
+            self._stopping = False
+            self._threads = [
+                threading.Thread(target=self._work, name=f"chat_worker_{i}", daemon=True) for i in range(self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=None):
+        """Let the workers finish what is queued, then join them."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, chat_id, task) -> bool:
+        """Queue ``task`` behind the chat's earlier tasks; False when the chat's queue is full and it was dropped."""
+        with self._condition:
+            while chat_id not in self.queues and len(self.queues) >= self.max_chats:
+                self._condition.wait()
+            tasks = self.queues.setdefault(chat_id, deque())
+            if len(tasks) >= self.max_pending:
+                self.dropped += 1
+                metrics.dispatch_dropped.inc()
+                return False
+            tasks.append(task)
+            if len(tasks) == 1 and chat_id not in self.running:
+                self.ready.append(chat_id)
+                self._condition.notify_all()
+            return True
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self.ready and not (self._stopping and not self.queues):
+                    self._condition.wait()
+                if not self.ready:
+                    return
+                chat_id = self.ready.popleft()
+                self.running.add(chat_id)
+                task = self.queues[chat_id].popleft()
+            try:
+                task()
+            except Exception:
+                logger.exception("task of chat %s failed", chat_id)
+            finally:
+                with self._condition:
+                    self.running.discard(chat_id)
+                    if self.queues[chat_id]:
+                        self.ready.append(chat_id)
+                    else:
+                        del self.queues[chat_id]
+                    self._condition.notify_all()
+
+
+class ChatDispatcher(Dispatcher):
+    """
+    Dispatcher that hands updates to a ChatScheduler instead of running the handlers in its own thread,
+    so a slow handler only holds up later updates of the same chat.
+    """
+
+    def __init__(self, *args, scheduler: ChatScheduler, deduplicator=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler
+        self.deduplicator = deduplicator
+
+    def process_update(self, update):
+        self.schedule_update(update)
+
+    def schedule_update(self, update, done=None):
+        """Process ``update`` on the chat's queue; ``done`` is called after it was handled or dropped."""
+        if isinstance(update, TelegramError):
+            # polling errors go straight to the error handlers
+            super().process_update(update)
+            return
+        task = functools.partial(self._run_update, update, done)
+        self.scheduler.start()
+        if not self.scheduler.submit(get_chat_id(update), task):
+            logger.warning("chat %s has too many pending updates, dropped update %s",
+                           get_chat_id(update), update.update_id)
+            if done is not None:
+                done()
+
+    def _run_update(self, update, done):
+        # worker threads keep their own database connections, drop the broken or expired ones
+        close_old_connections()
+        try:
+            if self.deduplicator is None:
+                super().process_update(update)
+                return
+            if not self.deduplicator.claim(update.update_id):
+                logger.info("dropped redelivered update %s", update.update_id)
+                return
+            try:
+                super().process_update(update)
+            except BaseException:
+                self.deduplicator.release(update.update_id)
+                raise
+            self.deduplicator.done(update.update_id)
+        finally:
+            if done is not None:
+                done()
+
+    def stop(self):
+        super().stop()
+        self.scheduler.stop()
@@ -1,15 +1,25 @@
 from django.conf import settings
-from telegram.ext import CallbackQueryHandler, MessageHandler, Filters, ConversationHandler
+from telegram.ext import (
+    CallbackQueryHandler, MessageHandler, Filters, ConversationHandler, TypeHandler, DispatcherHandlerStop
+)
 from telegram.ext.commandhandler import CommandHandler
 from telegram.update import Update
 from telegram.ext.callbackcontext import CallbackContext
-from telegram import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
-from gpt_bot.models import TelegramUser, FlowProcess, Question, Specialization, Region, UserLimit
+from telegram import ReplyKeyboardMarkup, KeyboardButton
+from gpt_bot import metrics
+from gpt_bot.models import FlowProcess, Question, normalize_phone_number
 from .loader import updater
-from django.db.models import F
-from django.core.cache import cache
+from .state_store import state_store, update as update_state
+from .user_registry import user_registry
+from .reference_data import reference_data
+from .questions import generate_questions, normalize_specializations
+from .llm_control import LLMUnavailable
+from .idempotency import SingleFlight
+from .delivery import ResumeDelivery
+from . import cv_ingest, question_bank, question_stream, prefetch, quota, resume_jobs
+import atexit
 import datetime
-import openai
+import functools
 
 
 class State:
@@ -31,55 +41,79 @@ class State:
 
 
 def init_user(func):
+    @functools.wraps(func)
     def wrapper(update: Update, context: CallbackContext):
-        chat_id = update.effective_chat.id
-        TelegramUser.objects.get_or_create(
-            user_id=chat_id,
-            defaults={
-                "username": update.effective_chat.username,
-            }
-        )
+        user_registry.touch(update.effective_chat.id, update.effective_chat.username)
         return func(update, context)
 
     return wrapper
 
 
-openai.api_key = settings.OPENAI_API_KEY
+def start_question_stage(message, question_type, categories=None):
+    """Set up the question state of the stage and send its first question."""
+    user_id = message.chat.id
+    specialization_key = normalize_specializations(categories)
+    questions = prefetch.pop(user_id, question_type, categories)
+    if not questions:
+        questions = question_bank.take(question_type, specialization_key)
+    if not questions:
+        message.reply_text("🔄Генерация вопросов...")
+        try:
+            if settings.LLM_STREAM_QUESTIONS:
+                # the rest of the questions are appended to the state in the background
+                message.reply_text(question_stream.start(f"question_state_{user_id}", question_type, specialization_key))
+                return
+            questions = generate_questions(question_type, specialization_key)
+        except LLMUnavailable as e:
+            # an empty stage is started again by the next message of the user
+            set_cur_question_state(user_id, {"questions": [], "index": 0, "question_type": question_type})
+            message.reply_text(e.message)
+            return
+    set_cur_question_state(user_id, {"questions": questions, "index": 0, "question_type": question_type})
+    message.reply_text(questions[0])
 
 
-def ask_gpt(prompt):
-    question = openai.Completion.create(
-        model="text-davinci-003",
-        temperature=0.7,
-        prompt=prompt,
-        max_tokens=1000,
-        top_p=1,
-        n=1,
-        frequency_penalty=0,
-        presence_penalty=0,
-        stop=None
-    )
-    return question.choices[0].text
-
-
-def get_iq_questions() -> list:
-    prompt = "Give 10 questions for testing my IQ. Question in russian."
-    question = openai.Completion.create(
-        model="text-davinci-003",
-        temperature=0.7,
-        prompt=prompt,
-        max_tokens=2000,
-        top_p=1,
-        n=1,
-        frequency_penalty=0,
-        presence_penalty=0,
-        stop=None
+def refill_question_bank(context: CallbackContext):
+    question_bank.refill()
+
+
+resume_delivery = ResumeDelivery(updater.bot)
+
+
+def send_resume(job, process):
+    resume_delivery.send(job.chat_id, process)
+
+
+def send_resume_failed(job):
+    updater.bot.send_message(
+        job.chat_id, "👨‍💼К сожалению, не удалось подготовить резюме. Пожалуйста, обратитесь к администратору."
     )
-    iq_questions = []
-    for q in question.choices[0].text.split("\n"):
-        if q:
-            iq_questions.append(q)
-    return iq_questions
+
+
+# repeated expensive steps of a chat, e.g. a double tap on "save", share the first run
+flights = SingleFlight(state_store, ttl=settings.SINGLE_FLIGHT_TTL, timeout=settings.SINGLE_FLIGHT_TIMEOUT)
+
+resume_pool = resume_jobs.ResumeRenderPool(
+    send_resume,
+    send_resume_failed,
+    workers=settings.RESUME_RENDER_WORKERS,
+    max_in_flight=settings.RESUME_JOB_CONCURRENCY,
+)
+cv_ingestor = cv_ingest.CVIngestor(
+    cv_ingest.get_file_source(updater.bot),
+    max_size=settings.CV_MAX_SIZE,
+    concurrency=settings.CV_INGEST_CONCURRENCY,
+    retries=settings.CV_INGEST_RETRIES,
+)
+atexit.register(cv_ingestor.close)
+
+
+def poll_resume_jobs(context: CallbackContext):
+    resume_pool.poll()
+
+
+def flush_user_registry(context: CallbackContext):
+    user_registry.flush()
 
 
 phone_request_button = ReplyKeyboardMarkup(
@@ -96,6 +130,7 @@ gender_choices = ReplyKeyboardMarkup(
 
 @init_user
 def send_welcome(update: Update, context: CallbackContext):
+    prefetch.cancel(update.effective_chat.id)
     update.message.reply_text(
         "👨‍💼Добро пожаловать! Пожалуйста, укажите свой номер телефона:",
         reply_markup=phone_request_button
@@ -104,18 +139,19 @@ def send_welcome(update: Update, context: CallbackContext):
 
 
 def get_user_conv_data(user_id) -> dict:
-    return cache.get(f"conv_data_{user_id}", {})
+    return state_store.get(f"conv_data_{user_id}")
 
 
 def set_user_conv_data(user_id, data) -> None:
-    cache.set(f"conv_data_{user_id}", data, timeout=60 * 60 * 24)
+    state_store.replace(f"conv_data_{user_id}", data, ttl=settings.CONV_STATE_TTL)
+
 
+def update_user_conv_data(user_id, **fields) -> None:
+    state_store.set_fields(f"conv_data_{user_id}", fields, ttl=settings.CONV_STATE_TTL)
 
-def save_user_conv_data(user_id, data) -> None:
-    def get_file_from_id(file_id):
-        file = updater.bot.get_file(file_id)
-        return file.file_path
 
+def save_user_conv_data(user_id, data) -> int:
+    user_registry.ensure_saved(user_id)
     process = FlowProcess.objects.create(
         telegram_user_id=user_id,
         full_name=data["full_name"],
@@ -123,36 +159,66 @@ def save_user_conv_data(user_id, data) -> None:
         birth_date=data["birth_date"],
         gender="male" if data["gender"] == "Мужской" else "famale",
         region_id=data["region"],
-        cv=get_file_from_id(data["cv_file_id"]),
+        cv_file_id=data["cv_file_id"],
     )
+    cv_ingestor.submit(process.id, data["cv_file_id"])
     process.specialization.set(data["categories"])
     data["process_id"] = process.id
-    set_user_conv_data(user_id, data)
+    update_user_conv_data(user_id, process_id=process.id)
+    return process.id
 
 
 def get_cur_question_state(user_id) -> dict:
-    return cache.get(f"question_state_{user_id}")
+    return state_store.get(f"question_state_{user_id}")
 
 
 def set_cur_question_state(user_id, data):
-    return cache.set(f"question_state_{user_id}", data, timeout=60 * 60 * 24)
+    state_store.replace(f"question_state_{user_id}", data, ttl=settings.CONV_STATE_TTL)
+
+
+def update_cur_question_state(user_id, **fields):
+    state_store.set_fields(f"question_state_{user_id}", fields, ttl=settings.CONV_STATE_TTL)
+
+
+def flush_answers(user_id, data=None, process_id=None):
+    """Persist the answers buffered in the question state (``answer_<index>`` fields) with one bulk upsert."""
+    data = data if data is not None else get_cur_question_state(user_id)
+    process_id = process_id or get_user_conv_data(user_id).get("process_id")
+    fields = [field for field in data if field.startswith("answer_")]
+    if not process_id or not fields:
+        return
+    Question.objects.bulk_create(
+        [
+            Question(
+                process_id=process_id,
+                index=int(field[len("answer_"):]),
+                question_type=data["question_type"],
+                question=data["questions"][int(field[len("answer_"):])],
+                answer=data[field],
+            )
+            for field in fields
+        ],
+        update_conflicts=True,
+        # column name, Django 4.1 puts unique_fields into ON CONFLICT verbatim
+        unique_fields=["process_id", "question_type", "index"],
+        update_fields=["question", "answer"],
+    )
+    state_store.delete_fields(f"question_state_{user_id}", *fields)
 
 
 @init_user
 def get_user_contact(update: Update, context: CallbackContext):
-    phone_number = update.message.contact.phone_number
-    phone_number = "".join(phone_number.split())
-    print(phone_number)
+    phone_number = normalize_phone_number(update.message.contact.phone_number)
     data = {
         "phone_number": phone_number
     }
-    allow = UserLimit.objects.filter(used__lt=F("limit"), phone_number=phone_number).first()
-    # if not allow:
-    #     update.message.reply_text(
-    #         "👨‍💼К сожалению, вы не можете пройти тестирование. Пожалуйста, обратитесь к администратору.")
-    #     return ConversationHandler.END
-    allow.used = F("used") + 1
-    allow.save(update_fields=["used"])
+    if not quota.consume(phone_number):
+        update.message.reply_text(
+            "👨‍💼К сожалению, вы не можете пройти тестирование. Пожалуйста, обратитесь к администратору.")
+        return ConversationHandler.END
+    # only candidates with an attempt left get their tests generated
+    prefetch.start(update.message.chat.id, "iq_test")
+    prefetch.start(update.message.chat.id, "soft_skill")
     set_user_conv_data(update.message.chat.id, data)
     update.message.reply_text("👨‍💼Спасибо! Пожалуйста введите свое полное имя:")
     return State.ENTER_FULL_NAME
@@ -161,33 +227,20 @@ def get_user_contact(update: Update, context: CallbackContext):
 @init_user
 def get_user_full_name(update: Update, context: CallbackContext):
     full_name = update.message.text
-    data = get_user_conv_data(update.message.chat.id)
-    data["full_name"] = full_name
-    set_user_conv_data(update.message.chat.id, data)
+    update_user_conv_data(update.message.chat.id, full_name=full_name)
     update.message.reply_text("👨‍💼Спасибо! Пожалуйста введите свою дату рождения (dd.mm.yyyy):")
     return State.ENTER_BIRTH_DATE
 
 
 def get_regions_board():
-    regions = [[]]
-    for r in Region.objects.all():
-        name = r.name
-        if len(regions[-1]) < 2:
-            regions[-1].append(InlineKeyboardButton(name, callback_data=str(r.id)))
-        else:
-            regions.append([InlineKeyboardButton(name, callback_data=str(r.id))])
-    regions_board = InlineKeyboardMarkup(regions)
-    return regions_board
+    return reference_data.get_regions_board()
 
 
 @init_user
 def get_user_birth_date(update: Update, context: CallbackContext):
     birth_date = update.message.text
-    print(birth_date)
     date = datetime.datetime.strptime(birth_date, "%d.%m.%Y")
-    data = get_user_conv_data(update.message.chat.id)
-    data["birth_date"] = date
-    set_user_conv_data(update.message.chat.id, data)
+    update_user_conv_data(update.message.chat.id, birth_date=date)
     update.message.reply_text("👨‍💼Спасибо! Пожалуйста введите свой регион:", reply_markup=get_regions_board())
     return State.ENTER_REGION
 
@@ -197,11 +250,9 @@ def get_user_region(update: Update, context: CallbackContext):
     update.callback_query.message.edit_reply_markup(reply_markup=None)
     region = update.callback_query.data
     update.callback_query.message.edit_text(
-        f"👨‍💼Спасибо! Пожалуйста введите свой регион:\n{Region.objects.get(id=region).name}")
+        f"👨‍💼Спасибо! Пожалуйста введите свой регион:\n{reference_data.get_region_name(region)}")
     user_id = update.effective_chat.id
-    data = get_user_conv_data(user_id)
-    data["region"] = region
-    set_user_conv_data(user_id, data)
+    update_user_conv_data(user_id, region=region)
     update.callback_query.message.reply_text("👨‍💼Спасибо! Пожалуйста введите свой пол:", reply_markup=gender_choices)
     return State.ENTER_GENDER
 
@@ -211,39 +262,20 @@ def get_user_gender(update: Update, context: CallbackContext):
     gender = update.message.text
     if gender not in ["Мужской", "Женский"]:
         return State.ENTER_GENDER
-    data = get_user_conv_data(update.message.chat.id)
-    data["gender"] = gender
-    set_user_conv_data(update.message.chat.id, data)
+    update_user_conv_data(update.message.chat.id, gender=gender)
     # send cv
     update.message.reply_text("👨‍💼Спасибо! Пожалуйста отправьте свое резюме:")
     return State.ENTER_CV
 
 
 def get_user_category_board(user_id, selected_categories=None):
-    selected_categories = selected_categories or []
-    categories = [[]]
-    for c in Specialization.objects.all():
-        name = c.name
-        if str(c.id) in selected_categories:
-            name = f"✅{name}"
-        if len(categories[-1]) < 2:
-            categories[-1].append(InlineKeyboardButton(name, callback_data=str(c.id)))
-        else:
-            categories.append([InlineKeyboardButton(name, callback_data=str(c.id))])
-    if len(categories[-1]) < 2:
-        categories[-1].append(InlineKeyboardButton("Сохранить", callback_data="save"))
-    else:
-        categories.append([InlineKeyboardButton("Сохранить", callback_data="save")])
-    categories_board = InlineKeyboardMarkup(categories)
-    return categories_board
+    return reference_data.get_category_board(selected_categories)
 
 
 @init_user
 def get_user_cv(update: Update, context: CallbackContext):
     cv = update.message.document or update.message.photo[-1]
-    data = get_user_conv_data(update.message.chat.id)
-    data["cv_file_id"] = cv.file_id
-    set_user_conv_data(update.message.chat.id, data)
+    update_user_conv_data(update.message.chat.id, cv_file_id=cv.file_id)
     categories_board = get_user_category_board(update.message.chat.id)
     update.message.reply_text("👨‍💼Спасибо! Пожалуйста выберите категории, в которых вы хотите работать:",
                               reply_markup=categories_board)
@@ -253,88 +285,33 @@ def get_user_cv(update: Update, context: CallbackContext):
 def get_user_category(update: Update, context: CallbackContext):
     query = update.callback_query
     user_id = update.callback_query.from_user.id
-    data = get_user_conv_data(user_id)
-    data.setdefault("categories", list())
     if query.data != "save":
-        if query.data in data["categories"]:
-            data["categories"].remove(query.data)
-        else:
-            data["categories"].append(query.data)
-        set_user_conv_data(user_id, data)
+        def toggle_category(data):
+            categories = data.get("categories", [])
+            if query.data in categories:
+                categories.remove(query.data)
+            else:
+                categories.append(query.data)
+            return {"categories": categories}
+
+        data = update_state(state_store, f"conv_data_{user_id}", toggle_category, ttl=settings.CONV_STATE_TTL)
         categories_board = get_user_category_board(user_id, data["categories"])
         update.callback_query.message.edit_reply_markup(reply_markup=categories_board)
         return State.ENTER_CATEGORIES
-    if not data["categories"]:
+    data = get_user_conv_data(user_id)
+    if not data.get("categories"):
         context.bot.answer_callback_query(query.id, "Выберите хотя бы одну категорию", show_alert=True)
         return State.ENTER_CATEGORIES
-    set_user_conv_data(user_id, data)
-    save_user_conv_data(user_id, data)
-    update.callback_query.message.reply_text(
-        "📝Спасибо! Ваша информация сохранена.\n"
-        "🔄Генерация вопросов..."
-    )
-    iq_questions = get_iq_questions()
-    set_cur_question_state(user_id, {"questions": iq_questions, "index": 0, "question_type": "iq_test"})
-    update.callback_query.message.reply_text(iq_questions[0])
-    return State.ENTER_QUESTION_ANSWER
 
+    def save():
+        prefetch.start(user_id, "professional_test", data["categories"])
+        save_user_conv_data(user_id, data)
+        update.callback_query.message.reply_text("📝Спасибо! Ваша информация сохранена.")
+        start_question_stage(update.callback_query.message, "iq_test")
 
-def analize_user_answers(process_id):
-    iq_tests = Question.objects.filter(process_id=process_id, question_type="iq_test")
-    result = ask_gpt(
-        "\n".join(["%s\nОтвет: %s" % (q.question, q.answer) for q in iq_tests]) +
-        "\n\nосноваясь выщеуказанным ответам дай суммарный балл по шкале 1 - 250 для "
-        "определения IQ интеллект и верни только цифру."
-    )
-
-    def parse_int(st):
-        try:
-            return int("".join([c for c in st if c.isdigit()]))
-        except TypeError:
-            return 0
-
-    iq_score = parse_int(result)
-    soft_skill_tests = Question.objects.filter(process_id=process_id, question_type="soft_skill")
-    prompt = (
-            "\n".join(["%s\nОтвет: %s" % (q.question, q.answer) for q in soft_skill_tests]) +
-            "\n\nПроанализируй ответы кандидата на вопросы по софт-скиллам и верни результат в виде текста."
-    )
-    soft_skill_main_result = ask_gpt(prompt).strip()
-    if soft_skill_main_result.startswith("Ответ:"):
-        soft_skill_main_result = soft_skill_main_result[len("Ответ:"):]
-    prompt = (
-            "\n".join(["%s\nОтвет: %s" % (q.question, q.answer) for q in soft_skill_tests]) +
-            "\n\nПроанализируй ответы кандидата на вопросы по софт-скиллам и рекомендации по улучшению."
-    )
-    soft_skill_recommendations = ask_gpt(prompt).strip()
-    if soft_skill_recommendations.startswith("Ответ:"):
-        soft_skill_recommendations = soft_skill_recommendations[len("Ответ:"):]
-
-    tech_tests = Question.objects.filter(process_id=process_id, question_type="professional_test")
-    prompt = (
-            "\n".join(["%s\nОтвет: %s" % (q.question, q.answer) for q in tech_tests]) +
-            "\n\nПроанализируй ответы кандидата на вопросы по техническим навыкам и верни результат в виде текста."
-    )
-    tech_main_result = ask_gpt(prompt).strip()
-    if tech_main_result.startswith("Ответ:"):
-        tech_main_result = tech_main_result[len("Ответ:"):]
-    prompt = (
-            "\n".join(["%s\nОтвет: %s" % (q.question, q.answer) for q in tech_tests]) +
-            "\n\nПроанализируй ответы кандидата на вопросы по техническим навыкам и рекомендации по улучшению."
-    )
-    tech_recommendations = ask_gpt(prompt).strip()
-    if tech_recommendations.startswith("Ответ:"):
-        tech_recommendations = tech_recommendations[len("Ответ:"):]
-    FlowProcess.objects.filter(id=process_id).update(
-        iq_test_score=iq_score,
-        soft_skill_main_result=soft_skill_main_result,
-        soft_skill_recommendation=soft_skill_recommendations,
-        professional_test_main_result=tech_main_result,
-        professional_test_recommendation=tech_recommendations
-    )
-    process = FlowProcess.objects.get(id=process_id)
-    process.generate_resume()
-    return process
+    # keyed by the categories message: a double tap shares one save, a later /start saves again
+    flights.do((user_id, State.ENTER_CATEGORIES, f"save_{query.message.message_id}"), save)
+    return State.ENTER_QUESTION_ANSWER
 
 
 @init_user
@@ -347,60 +324,69 @@ def get_user_question_answer(update: Update, context: CallbackContext):
 
     data = get_cur_question_state(update.message.chat.id)
     conv_data = get_user_conv_data(update.message.chat.id)
-    question = data["questions"][data["index"]]
+    if not data.get("questions"):
+        categories = conv_data["categories"] if data["question_type"] == "professional_test" else None
+        start_question_stage(update.message, data["question_type"], categories)
+        return State.ENTER_QUESTION_ANSWER
+    if not data.get("complete", True) and data["index"] == len(data["questions"]) - 1:
+        data = question_stream.wait_for_question(f"question_state_{update.message.chat.id}", data["index"] + 1)
     question_type = data["question_type"]
-    Question.objects.update_or_create(
-        process_id=conv_data["process_id"],
-        index=data["index"], question_type=question_type,
-        defaults={"question": question, "answer": answer}
-    )
+    data[f"answer_{data['index']}"] = answer
     if data["index"] == len(data["questions"]) - 1:
-        if question_type == "iq_test":
-            update.message.reply_text("🔄Генерация вопросов...")
-            questions = ask_gpt(
-                "Сформулируйте 10 вопрос, связанный с софт-навыком <<коммуникация>>, <<руководство>>,"
-                "<<решение проблем>>, <<адаптивность>>."
-            )
-            soft_skill_questions = []
-            for q in questions.split("\n"):
-                if q:
-                    soft_skill_questions.append(q)
-
-            set_cur_question_state(update.message.chat.id,
-                                   {"questions": soft_skill_questions, "index": 0, "question_type": "soft_skill"})
-            update.message.reply_text(soft_skill_questions[0])
-            return State.ENTER_QUESTION_ANSWER
-        elif question_type == "soft_skill":
-            techs = list(Specialization.objects.filter(id__in=conv_data["categories"]).values_list("name", flat=True))
-            for i in range(len(techs)):
-                techs[i] = f"<<{techs[i]}>>"
-            update.message.reply_text("🔄Генерация вопросов...")
-            questions = ask_gpt(
-                "Сформулируйте 10 вопрос, связанный с технологиями " + ", ".join(techs) + "."
-            )
-            tech_skill_questions = []
-            for q in questions.split("\n"):
-                if q:
-                    tech_skill_questions.append(q)
-            set_cur_question_state(update.message.chat.id, {"questions": tech_skill_questions, "index": 0,
-                                                            "question_type": "professional_test"})
-            update.message.reply_text(tech_skill_questions[0])
-            return State.ENTER_QUESTION_ANSWER
-        else:  # professional_test
-            update.message.reply_text("📝Спасибо! Ваши ответы сохранены.")
-            update.message.reply_text("🔄Подготовка резюме...")
-            process = analize_user_answers(conv_data["process_id"])
-            update.message.reply_document(
-                document=open(process.generated_resume.path, "rb"),
-                caption="📄Ваше резюме готово!"
-            )
+        # a resent last answer finds the stage already finished and is ignored
+        flights.do(
+            (update.message.chat.id, State.ENTER_QUESTION_ANSWER, f"finish_{conv_data['process_id']}_{question_type}"),
+            lambda: finish_question_stage(update.message, data, conv_data),
+        )
+        return State.ENTER_QUESTION_ANSWER
     else:
-        data["index"] += 1
-        update.message.reply_text(data["questions"][data["index"]])
-        set_cur_question_state(update.message.chat.id, data)
+        next_index = data["index"] + 1
+        update_cur_question_state(update.message.chat.id, index=next_index, **{f"answer_{data['index']}": answer})
+        update.message.reply_text(data["questions"][next_index])
         return State.ENTER_QUESTION_ANSWER
 
 
+def finish_question_stage(message, data, conv_data):
+    flush_answers(message.chat.id, data, conv_data["process_id"])
+    if data["question_type"] == "iq_test":
+        start_question_stage(message, "soft_skill")
+    elif data["question_type"] == "soft_skill":
+        start_question_stage(message, "professional_test", conv_data["categories"])
+    else:  # professional_test
+        prefetch.cancel(message.chat.id)
+        message.reply_text("📝Спасибо! Ваши ответы сохранены.")
+        message.reply_text("🔄Подготовка резюме...")
+        resume_jobs.enqueue(conv_data["process_id"], message.chat.id)
+        resume_pool.poll()
+
+
+def send_last_resume(update: Update, context: CallbackContext):
+    process = (
+        FlowProcess.objects.filter(telegram_user_id=update.effective_chat.id, generated_resume__gt="")
+        .order_by("-created_at")
+        .first()
+    )
+    if process is None:
+        update.message.reply_text("👨‍💼Резюме еще не готово.")
+    else:
+        resume_delivery.send(update.effective_chat.id, process)
+    # answered here, not as a test answer of the conversation
+    raise DispatcherHandlerStop()
+
+
+def cancel_conversation(update: Update, context: CallbackContext):
+    prefetch.cancel(update.effective_chat.id)
+    flush_answers(update.effective_chat.id)
+    if update.effective_message:
+        update.effective_message.reply_text("👨‍💼Тестирование отменено. Чтобы начать заново, отправьте /start")
+    return ConversationHandler.END
+
+
+def abandon_conversation(update: Update, context: CallbackContext):
+    prefetch.cancel(update.effective_chat.id)
+    flush_answers(update.effective_chat.id)
+
+
 question_conv_handler = ConversationHandler(
     entry_points=[
         CommandHandler('start', send_welcome)
@@ -414,8 +400,17 @@ question_conv_handler = ConversationHandler(
         State.ENTER_CV: [MessageHandler(Filters.document | Filters.photo, get_user_cv)],
         State.ENTER_CATEGORIES: [CallbackQueryHandler(get_user_category)],
         State.ENTER_QUESTION_ANSWER: [MessageHandler(Filters.text, get_user_question_answer)],
+        ConversationHandler.TIMEOUT: [TypeHandler(Update, abandon_conversation)],
     },
-    fallbacks=[]
+    fallbacks=[CommandHandler('cancel', cancel_conversation)],
+    conversation_timeout=settings.CONVERSATION_TIMEOUT,
+    name="question_conv_handler",
+    persistent=True,
 )
 
+metrics.instrument_conversation(question_conv_handler, State)
+updater.dispatcher.add_handler(CommandHandler("resume", send_last_resume), group=-1)
 updater.dispatcher.add_handler(question_conv_handler)
+updater.job_queue.run_repeating(refill_question_bank, interval=settings.QUESTION_BANK_REFILL_INTERVAL, first=10)
+updater.job_queue.run_repeating(flush_user_registry, interval=settings.USER_REGISTRY_FLUSH_INTERVAL, first=1)
+updater.job_queue.run_repeating(poll_resume_jobs, interval=settings.RESUME_JOB_POLL_INTERVAL, first=1)
@@ -0,0 +1,115 @@
+import threading
+import time
+
+from gpt_bot import metrics
+
+
+class FlightTimeout(Exception):
+    pass
+
+
+class UpdateDeduplicator:
+    """
+    Remembers handled update ids in the state store, so a redelivered update is seen by every worker.
+
+    An update is claimed for ``processing_ttl`` seconds while it is processed and remembered for ``ttl``
+    seconds once it was; an update whose processing failed, or whose worker died, can be processed again.
+    """
+
+    def __init__(self, store, ttl=60 * 60, processing_ttl=120):
+        self.store = store
+        self.ttl = ttl
+        self.processing_ttl = processing_ttl
+
+    def claim(self, update_id) -> bool:
+        """False when the update is processed, or was, by another delivery."""
+        # version 0 means the key does not exist, so only the first claim succeeds
+        if self.store.compare_and_set(f"update_{update_id}", 0, {"processing": True}, ttl=self.processing_ttl):
+            return True
+        metrics.idempotency_hits.labels("update").inc()
+        return False
+
+    def done(self, update_id):
+        self.store.replace(f"update_{update_id}", {"done": True}, ttl=self.ttl)
+
+    def release(self, update_id):
+        self.store.delete(f"update_{update_id}")
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time across the processes sharing the state store. Callers that arrive
+    while it runs, or up to ``ttl`` seconds after it finished, get its result instead of running it again.
+    A failed call is forgotten, so the next caller runs it. Results must be picklable.
+
+    The running call's claim lives ``lease`` seconds and is renewed while the call runs, so a long call
+    keeps it and the claim of a leader that died expires soon. Waiters give up after ``timeout`` seconds.
+    """
+
+    def __init__(self, store, ttl=60, timeout=120, lease=30, poll_interval=0.1):
+        self.store = store
+        self.ttl = ttl
+        self.timeout = timeout
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._calls = {}  # key -> Event set when the call led by this process finishes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(key) -> str:
+        return "flight_" + "_".join(str(part) for part in key)
+
+    def do(self, key, func):
+        """Return ``(result, shared)``; ``shared`` is True when the result of another call was reused."""
+        store_key = self.make_key(key)
+        while True:
+            with self._lock:
+                event = self._calls.get(store_key)
+                leader = event is None and self.store.compare_and_set(
+                    store_key, 0, {"running": True}, ttl=self.lease)
+                if leader:
+                    self._calls[store_key] = threading.Event()
+            if leader:
+                break
+            data = self.wait(store_key, event)
+            if "result" in data:
+                metrics.idempotency_hits.labels("flight").inc()
+                return data["result"], True
+            # the leader failed, the next round runs the call again
+        finished = threading.Event()
+        renewal = threading.Thread(target=self.renew, args=(store_key, finished), daemon=True)
+        renewal.start()
+        try:
+            try:
+                result = func()
+            finally:
+                # no renewal may land after the result was stored with its own ttl
+                finished.set()
+                renewal.join()
+        except BaseException:
+            self.store.delete(store_key)
+            raise
+        else:
+            self.store.replace(store_key, {"result": result}, ttl=self.ttl)
+            return result, False
+        finally:
+            with self._lock:
+                self._calls.pop(store_key).set()
+
+    def renew(self, store_key, finished):
+        while not finished.wait(self.lease / 3):
+            self.store.touch(store_key, self.lease)
+
+    def wait(self, store_key, event) -> dict:
+        """Wait until the call finished; an empty dict means it failed."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            if event is not None:
+                event.wait(self.timeout)
+                event = None
+            data = self.store.get(store_key)
+            if "result" in data or not data:
+                return data
+            if time.monotonic() >= deadline:
+                raise FlightTimeout(store_key)
+            time.sleep(self.poll_interval)
@@ -0,0 +1,228 @@
+import asyncio
+import atexit
+import json
+import threading
+import time
+
+import aiohttp
+from django.conf import settings
+
+from gpt_bot import metrics
+
+from .llm_cache import get_cache_key, get_llm_cache
+from .llm_control import LLMControl, LLMUnavailable, CircuitBreaker, is_retryable
+
+
+class LLMError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class LLMClient:
+    """
+    Completion client that keeps one pooled keep-alive HTTP session on a
+    dedicated event loop thread.
+
+    Coroutines (``acomplete``) run on that loop; ``submit`` schedules them from
+    any thread and ``complete`` is the blocking facade used by the handlers.
+    Every request goes through ``control`` for rate limiting and retries.
+    Call sites with deterministic prompts opt in to ``cache`` with ``cached=True``.
+    """
+
+    def __init__(self, api_key, api_base, timeout=60, connect_timeout=10, pool_size=100, keepalive_timeout=30,
+                 control=None, cache=None):
+        self.api_key = api_key
+        self.api_base = api_base.rstrip("/")
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self._loop = None
+        self._session = None
+        self._lock = threading.Lock()
+        self.control = control
+        self.cache = cache
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-client", daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive_timeout),
+                timeout=aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout),
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+        return self._session
+
+    @staticmethod
+    def get_payload(prompt, model="text-davinci-003", temperature=0.7, max_tokens=1000, **params) -> dict:
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "top_p": 1,
+            "n": 1,
+            "frequency_penalty": 0,
+            "presence_penalty": 0,
+            "stop": None,
+        }
+        payload.update(params)
+        return payload
+
+    @staticmethod
+    def estimate_tokens(payload) -> int:
+        # rough upper bound used for the tokens-per-minute budget
+        return len(payload["prompt"]) // 2 + payload["max_tokens"]
+
+    async def _post(self, payload) -> str:
+        async with self._get_session().post(f"{self.api_base}/completions", json=payload) as response:
+            data = await response.json(content_type=None)
+            if response.status != 200:
+                raise LLMError(f"completion failed with status {response.status}: {data}", status=response.status)
+        return data["choices"][0]["text"]
+
+    async def cache_get(self, payload):
+        if self.cache is None:
+            return None
+        return await asyncio.get_running_loop().run_in_executor(None, self.cache.get, get_cache_key(payload))
+
+    async def cache_set(self, payload, text):
+        if self.cache is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.cache.set, get_cache_key(payload), text)
+
+    async def _timed_post(self, payload, timing):
+        started = time.monotonic()
+        text = await self._post(payload)
+        if timing is not None:
+            timing["upstream"] = time.monotonic() - started
+        return text
+
+    async def acomplete(self, prompt, cached=False, validate=None, timing=None, **params) -> str:
+        """
+        ``validate(text)`` raises for a completion that must not be cached, and the error is passed on.
+        ``timing["upstream"]`` is set to the seconds the answered request took, without the time queued
+        in ``control``; it is not set for a cached completion.
+        """
+        payload = self.get_payload(prompt, **params)
+        if cached:
+            text = await self.cache_get(payload)
+            if text is not None:
+                return text
+        if self.control is None:
+            text = await self._timed_post(payload, timing)
+        else:
+            text = await self.control.call(
+                self._timed_post, payload, timing, estimated_tokens=self.estimate_tokens(payload)
+            )
+        if validate is not None:
+            validate(text)
+        if cached:
+            await self.cache_set(payload, text)
+        return text
+
+    async def _stream(self, payload):
+        async with self._get_session().post(f"{self.api_base}/completions", json=payload) as response:
+            if response.status != 200:
+                raise LLMError(
+                    f"completion failed with status {response.status}: {await response.text()}",
+                    status=response.status,
+                )
+            async for raw_line in response.content:
+                line = raw_line.decode().strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                yield json.loads(data)["choices"][0]["text"]
+
+    async def _controlled_stream(self, payload):
+        if self.control is None:
+            async for chunk in self._stream(payload):
+                yield chunk
+            return
+        attempt = 0
+        started = False
+        while True:
+            try:
+                async with self.control.slot(self.estimate_tokens(payload)):
+                    async for chunk in self._stream(payload):
+                        started = True
+                        yield chunk
+                return
+            except LLMUnavailable:
+                raise
+            except Exception as e:
+                if started or not is_retryable(e):
+                    raise
+                await self.control.backoff(attempt, e)
+                attempt += 1
+
+    async def astream(self, prompt, cached=False, **params):
+        """
+        Yield completion text deltas as the server-sent events arrive. A stream
+        is only retried until its first delta, after that the text is in use.
+        A cached completion is yielded as a single delta.
+        """
+        payload = self.get_payload(prompt, stream=True, **params)
+        text = await self.cache_get(payload) if cached else None
+        if text is not None:
+            yield text
+            return
+        chunks = []
+        async for chunk in self._controlled_stream(payload):
+            chunks.append(chunk)
+            yield chunk
+        if cached:
+            await self.cache_set(payload, "".join(chunks))
+
+    def submit(self, coro):
+        """Schedule a coroutine on the client loop and return a concurrent future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        return self.submit(coro).result()
+
+    def complete(self, prompt, **params) -> str:
+        return self.run(self.acomplete(prompt, **params))
+
+    async def aclose(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def close(self):
+        if self._loop is not None:
+            self.run(self.aclose())
+
+
+llm = LLMClient(
+    api_key=settings.OPENAI_API_KEY,
+    api_base=settings.OPENAI_API_BASE,
+    timeout=settings.OPENAI_TIMEOUT,
+    connect_timeout=settings.OPENAI_CONNECT_TIMEOUT,
+    pool_size=settings.OPENAI_POOL_SIZE,
+    control=LLMControl(
+        requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+        max_concurrency=settings.LLM_MAX_CONCURRENCY,
+        max_retries=settings.LLM_MAX_RETRIES,
+        backoff_base=settings.LLM_BACKOFF_BASE,
+        backoff_max=settings.LLM_BACKOFF_MAX,
+        breaker=CircuitBreaker(
+            failure_threshold=settings.LLM_BREAKER_FAILURES,
+            reset_timeout=settings.LLM_BREAKER_RESET_TIMEOUT,
+        ),
+    ),
+    cache=get_llm_cache() if settings.LLM_CACHE_ENABLED else None,
+)
+atexit.register(llm.close)
+metrics.llm_queue_depth.set_function(lambda: llm.control.queued)
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+from django.conf import settings
+
+from gpt_bot import metrics
+
+
+def get_cache_key(payload: dict) -> str:
+    """Hash of model, sampling params and prompt; ``stream`` does not change the completion."""
+    data = {key: value for key, value in payload.items() if key != "stream"}
+    return "llm:" + hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+class BaseLLMCache:
+    def __init__(self, ttl=60 * 60 * 24, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key):
+        value = self._get(key)
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.llm_cache_requests.labels("miss" if value is None else "hit").inc()
+        return value
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0}
+
+
+class MemoryLLMCache(BaseLLMCache):
+    """Per-process LRU with expiry."""
+
+    def __init__(self, ttl=60 * 60 * 24, max_entries=10000):
+        super().__init__(ttl, max_entries)
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class SQLiteLLMCache(BaseLLMCache):
+    """File cache shared by the processes of one host; least recently used rows are evicted past ``max_entries``."""
+
+    def __init__(self, path, ttl=60 * 60 * 24, max_entries=10000):
+        super().__init__(ttl, max_entries)
+        self.path = path
+        self._local = threading.local()
+        self.connection.executescript(
+            "PRAGMA journal_mode=WAL;"
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, used_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at);"
+        )
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if getattr(self._local, "connection", None) is None:
+            self._local.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return self._local.connection
+
+    def _get(self, key):
+        now = time.time()
+        row = self.connection.execute(
+            "SELECT value FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        self.connection.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO responses (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+            (key, value, now + self.ttl, now),
+        )
+        self.connection.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        self.connection.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+
+class RedisLLMCache(BaseLLMCache):
+    """Shared by every bot process; expiry by key TTL, size bound by the server ``maxmemory`` policy."""
+
+    def __init__(self, url, ttl=60 * 60 * 24, max_entries=10000):
+        import redis
+
+        super().__init__(ttl, max_entries)
+        self.client = redis.Redis.from_url(url)
+
+    def _get(self, key):
+        value = self.client.get(key)
+        return value.decode() if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(key, value, ex=self.ttl)
+
+
+def get_llm_cache(url=None):
+    url = url or settings.LLM_CACHE_URL
+    parsed = urlparse(url)
+    params = {"ttl": settings.LLM_CACHE_TTL, "max_entries": settings.LLM_CACHE_MAX_ENTRIES}
+    if parsed.scheme == "memory":
+        return MemoryLLMCache(**params)
+    if parsed.scheme == "sqlite":
+        return SQLiteLLMCache(parsed.path, **params)
+    if parsed.scheme in ("redis", "rediss"):
+        return RedisLLMCache(url, **params)
+    raise ValueError(f"unsupported llm cache url: {url}")
@@ -0,0 +1,203 @@
+import asyncio
+import contextlib
+import logging
+import random
+import time
+from collections import deque
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMUnavailable(Exception):
+    message = "👨‍💼Сервис временно перегружен. Пожалуйста, отправьте любое сообщение через минуту, чтобы продолжить."
+
+
+def is_retryable(error) -> bool:
+    if isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError)):
+        return True
+    return getattr(error, "status", None) in RETRYABLE_STATUSES
+
+
+class TokenBucket:
+    """Refills ``rate_per_minute`` units per minute up to ``capacity``; callers wait for enough units."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        while True:
+            self.refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures and fails fast for
+    ``reset_timeout`` seconds, then lets a single trial call through.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def before_call(self) -> bool:
+        """Raise ``LLMUnavailable`` while open; True when the call is the half-open trial."""
+        state = self.state
+        if state == "open" or state == "half_open" and self.trial_in_flight:
+            raise LLMUnavailable()
+        if state == "half_open":
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def release_trial(self):
+        """The trial ended without an answer, e.g. it was cancelled; let the next call try."""
+        self.trial_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning("LLM circuit breaker opened after %s failures", self.failures)
+            self.opened_at = time.monotonic()
+
+
+class LLMControl:
+    """
+    Shared rate limiting, concurrency cap, retries and circuit breaking for every
+    model call. Lives on the LLM client loop, so no locking is needed.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, max_concurrency, max_retries=4,
+                 backoff_base=1, backoff_max=30, breaker=None):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._semaphore = None
+        self.queued = 0
+        self.max_queued = 0
+        self.in_flight = 0
+        self.waits = deque(maxlen=1000)
+        self.counters = {"calls": 0, "retries": 0, "failures": 0, "rejected": 0}
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # created lazily so it is bound to the LLM client loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    @contextlib.asynccontextmanager
+    async def slot(self, estimated_tokens):
+        """Wait for rate limit and concurrency budget; failures inside count towards the breaker."""
+        try:
+            trial = self.breaker.before_call()
+        except LLMUnavailable:
+            self.counters["rejected"] += 1
+            raise
+        try:
+            queued_at = time.monotonic()
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+            try:
+                await self.requests.acquire(1)
+                await self.tokens.acquire(estimated_tokens)
+                await self.semaphore.acquire()
+            finally:
+                self.queued -= 1
+            self.waits.append(time.monotonic() - queued_at)
+            self.in_flight += 1
+            self.counters["calls"] += 1
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+                self.semaphore.release()
+        except Exception as e:
+            if is_retryable(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        except BaseException:
+            # cancelled while queued or running (prefetch.cancel, a latency budget): says nothing about upstream
+            if trial:
+                self.breaker.release_trial()
+            raise
+        else:
+            self.breaker.record_success()
+
+    async def backoff(self, attempt, error):
+        """Sleep before retry ``attempt`` or give up with ``LLMUnavailable``."""
+        self.counters["failures"] += 1
+        if attempt >= self.max_retries:
+            raise LLMUnavailable() from error
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        logger.warning("LLM call failed (%r), retry %s in %.1fs", error, attempt + 1, delay)
+        self.counters["retries"] += 1
+        await asyncio.sleep(delay)
+
+    async def call(self, func, *args, estimated_tokens=1, **kwargs):
+        """Run ``await func(*args, **kwargs)`` retrying retryable errors with exponential backoff and jitter."""
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(estimated_tokens):
+                    return await func(*args, **kwargs)
+            except LLMUnavailable:
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                await self.backoff(attempt, e)
+                attempt += 1
+
+    def get_stats(self) -> dict:
+        waits = sorted(self.waits)
+        return {
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "in_flight": self.in_flight,
+            "wait_p50": waits[len(waits) // 2] if waits else 0,
+            "wait_p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0,
+            "wait_max": waits[-1] if waits else 0,
+            "breaker": self.breaker.state,
+            **self.counters,
+        }
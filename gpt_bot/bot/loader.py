@@ -1,7 +1,48 @@
+from queue import Queue
+from threading import Event
+
+from telegram.ext import ExtBot, JobQueue
 from telegram.ext.updater import Updater
 from telegram.update import Update
+from telegram.utils.request import Request
 
 from django.conf import settings
 
+from gpt_bot import metrics
+from .dispatch import ChatDispatcher, ChatScheduler
+from .idempotency import UpdateDeduplicator
+from .state_store import StatePersistence, state_store
+
+scheduler = ChatScheduler(
+    workers=settings.BOT_DISPATCH_WORKERS,
+    max_chats=settings.BOT_DISPATCH_MAX_CHATS,
+    max_pending=settings.BOT_DISPATCH_MAX_PENDING,
+)
+metrics.dispatch_queued.set_function(lambda: scheduler.queued)
+metrics.dispatch_chats_in_flight.set_function(lambda: scheduler.in_flight)
 
-updater = Updater(settings.BOT_TOKEN, use_context=True)
+bot = ExtBot(
+    settings.BOT_TOKEN,
+    base_url=f"{settings.TELEGRAM_API_URL}/bot",
+    base_file_url=f"{settings.TELEGRAM_API_URL}/file/bot",
+    # a connection for every chat worker and the run_async thread, plus the dispatcher, poller,
+    # job queue and main thread
+    request=Request(con_pool_size=settings.BOT_DISPATCH_WORKERS + 1 + 4),
+)
+job_queue = JobQueue()
+dispatcher = ChatDispatcher(
+    bot,
+    Queue(),
+    job_queue=job_queue,
+    # handlers run on the scheduler threads; PTB wants at least one run_async thread
+    workers=1,
+    exception_event=Event(),
+    persistence=StatePersistence(state_store),
+    use_context=True,
+    scheduler=scheduler,
+    deduplicator=UpdateDeduplicator(
+        state_store, ttl=settings.UPDATE_DEDUP_TTL, processing_ttl=settings.UPDATE_DEDUP_PROCESSING_TTL
+    ),
+)
+job_queue.set_dispatcher(dispatcher)
+updater = Updater(dispatcher=dispatcher, workers=None)
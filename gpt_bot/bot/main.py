@@ -1,4 +1,47 @@
+import threading
+
+from django.conf import settings
+
 from .loader import updater
 from .handlers import *  # to register handlers
+from . import sharding
+
+_lock = threading.Lock()
+
+
+def start_polling():
+    resume_pool.recover()
+    cv_ingestor.recover()
+    updater.bot.delete_webhook()
+    updater.start_polling()
+    # keep the main thread alive, otherwise interpreter shutdown starts and executors refuse new work
+    updater.idle()
+
+
+def start_dispatcher():
+    """Dispatcher and job queue without an update fetcher; updates are put on updater.update_queue."""
+    with _lock:
+        if updater.dispatcher.running:
+            return
+        resume_pool.recover()
+        cv_ingestor.recover()
+        updater.job_queue.start()
+        ready = threading.Event()
+        threading.Thread(target=updater.dispatcher.start, name="dispatcher", kwargs={"ready": ready},
+                         daemon=True).start()
+        ready.wait()
+
+
+def set_webhook():
+    updater.bot.set_webhook(
+        url=settings.TELEGRAM_WEBHOOK_URL,
+        secret_token=settings.TELEGRAM_WEBHOOK_SECRET,
+        max_connections=settings.TELEGRAM_WEBHOOK_MAX_CONNECTIONS,
+    )
+
 
-updater.start_polling()
+def run_shard_worker(shard):
+    resume_pool.recover()
+    cv_ingestor.recover()
+    updater.job_queue.start()
+    sharding.run_worker(updater.dispatcher, sharding.get_update_queue(), shard)
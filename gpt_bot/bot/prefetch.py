@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from gpt_bot.models import QuestionType
+from . import question_bank, question_stream
+from .llm import llm
+from .questions import agenerate_questions, get_question_prompt, normalize_specializations
+
+logger = logging.getLogger(__name__)
+
+_tasks = {}
+_lock = threading.Lock()
+
+
+def get_cache_key(user_id, question_type) -> str:
+    return f"question_state_{user_id}_{question_type}_prefetched"
+
+
+async def fetch_questions(user_id, question_type, specialization_key):
+    loop = asyncio.get_running_loop()
+    questions = await loop.run_in_executor(None, question_bank.take, question_type, specialization_key)
+    if not questions:
+        prompt = await loop.run_in_executor(None, get_question_prompt, question_type, specialization_key)
+        questions = await agenerate_questions(question_type, prompt)
+    cache.set(
+        get_cache_key(user_id, question_type),
+        {"questions": questions, "specialization_key": specialization_key},
+        timeout=settings.PREFETCH_TTL,
+    )
+    return questions
+
+
+def start(user_id, question_type, categories=None):
+    """Start generating a question set in the background, replacing any earlier prefetch of the same type."""
+    specialization_key = normalize_specializations(categories)
+    future = llm.submit(fetch_questions(user_id, question_type, specialization_key))
+    with _lock:
+        previous = _tasks.pop((user_id, question_type), None)
+        _tasks[(user_id, question_type)] = (specialization_key, future)
+    if previous is not None:
+        previous[1].cancel()
+    future.add_done_callback(lambda f: _forget(user_id, question_type, f))
+
+
+def _forget(user_id, question_type, future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("prefetch of %s for %s failed: %r", question_type, user_id, future.exception())
+    with _lock:
+        if _tasks.get((user_id, question_type), (None, None))[1] is future:
+            del _tasks[(user_id, question_type)]
+
+
+def pop(user_id, question_type, categories=None) -> list:
+    """
+    Prefetched questions for the stage, waiting for an in-flight prefetch if needed.
+    Returns None when nothing usable was prefetched.
+    """
+    specialization_key = normalize_specializations(categories)
+    with _lock:
+        task = _tasks.get((user_id, question_type))
+    if task is not None and task[0] == specialization_key:
+        try:
+            task[1].result(timeout=settings.PREFETCH_WAIT_TIMEOUT)
+        except Exception:
+            task[1].cancel()
+            return None
+    data = cache.get(get_cache_key(user_id, question_type))
+    cache.delete(get_cache_key(user_id, question_type))
+    if not data or data["specialization_key"] != specialization_key:
+        return None
+    return data["questions"]
+
+
+def cancel(user_id):
+    """
+    Drop every in-flight and finished prefetch of the user and stop the question stream
+    of the current stage, e.g. when the conversation is abandoned.
+    """
+    with _lock:
+        tasks = [_tasks.pop(key) for key in list(_tasks) if key[0] == user_id]
+    for _, future in tasks:
+        future.cancel()
+    cache.delete_many([get_cache_key(user_id, question_type) for question_type in QuestionType.values])
+    question_stream.cancel(f"question_state_{user_id}")
@@ -0,0 +1,166 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+
+from gpt_bot import metrics
+from .llm import llm
+
+logger = logging.getLogger(__name__)
+
+
+class PromptProfile:
+    """
+    Model settings of one call site. ``fallback_model`` is used while the
+    primary model is slower than ``latency_budget`` seconds; a single call
+    is cut off after ``timeout``, which also allows for generating ``max_tokens``.
+    """
+
+    def __init__(self, model, max_tokens, temperature=0.7, latency_budget=30, fallback_model=None, cached=False):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.latency_budget = latency_budget
+        self.fallback_model = fallback_model
+        self.cached = cached
+
+    def get_params(self, model) -> dict:
+        return {"model": model, "max_tokens": self.max_tokens, "temperature": self.temperature}
+
+    @property
+    def timeout(self) -> float:
+        return self.latency_budget + self.max_tokens / settings.LLM_ROUTER_TOKENS_PER_SECOND
+
+
+DEFAULT_MODEL = settings.LLM_DEFAULT_MODEL
+FAST_MODEL = settings.LLM_FAST_MODEL
+
+PROFILES = {
+    # question generation
+    "iq_generation": PromptProfile(DEFAULT_MODEL, 2000, latency_budget=20, fallback_model=FAST_MODEL),
+    "soft_skill_generation": PromptProfile(DEFAULT_MODEL, 2000, latency_budget=20, fallback_model=FAST_MODEL),
+    # the same specialization combination may share one generated set while it is cached
+    "tech_generation": PromptProfile(DEFAULT_MODEL, 2000, latency_budget=20, fallback_model=FAST_MODEL, cached=True),
+    # answer analysis, named after the FlowProcess fields they fill
+    "iq_test_score": PromptProfile(FAST_MODEL, 10, temperature=0, latency_budget=5, cached=True),
+    "soft_skill_main_result": PromptProfile(DEFAULT_MODEL, 1000, fallback_model=FAST_MODEL, cached=True),
+    "soft_skill_recommendation": PromptProfile(DEFAULT_MODEL, 1000, fallback_model=FAST_MODEL, cached=True),
+    "professional_test_main_result": PromptProfile(DEFAULT_MODEL, 1000, fallback_model=FAST_MODEL, cached=True),
+    "professional_test_recommendation": PromptProfile(DEFAULT_MODEL, 1000, fallback_model=FAST_MODEL, cached=True),
+    "structured_analysis": PromptProfile(DEFAULT_MODEL, 2000, temperature=0.2, latency_budget=45, cached=True),
+}
+
+
+class ModelRouter:
+    """
+    Picks the model of a profile from the observed latency: the primary model
+    while its p95 fits the latency budget, the fallback otherwise. Every
+    ``probe_every``-th call of a profile still goes to the primary so a recovery
+    is noticed. Latency is that of the upstream request: time queued in the
+    rate limiter and cache hits are left out.
+    """
+
+    def __init__(self, profiles, probe_every=10, min_samples=20):
+        self.profiles = profiles
+        self.probe_every = probe_every
+        self.min_samples = min_samples
+        self.latencies = defaultdict(lambda: deque(maxlen=200))
+        self.counters = defaultdict(itertools.count)
+
+    def get_percentile(self, name, model, percentile) -> float:
+        samples = sorted(self.latencies[(name, model)])
+        if not samples:
+            return 0
+        return samples[min(len(samples) - 1, int(len(samples) * percentile))]
+
+    def is_over_budget(self, name, model) -> bool:
+        profile = self.profiles[name]
+        if len(self.latencies[(name, model)]) < self.min_samples:
+            return False
+        return self.get_percentile(name, model, 0.95) > profile.latency_budget
+
+    def choose_model(self, name) -> str:
+        profile = self.profiles[name]
+        if profile.fallback_model is None or next(self.counters[name]) % self.probe_every == 0:
+            return profile.model
+        if self.is_over_budget(name, profile.model):
+            return profile.fallback_model
+        return profile.model
+
+    def record(self, name, model, seconds):
+        self.latencies[(name, model)].append(seconds)
+
+    async def acomplete_with(self, name, model, prompt, cached=None, validate=None) -> str:
+        profile = self.profiles[name]
+        cached = profile.cached if cached is None else cached
+        started = time.monotonic()
+        outcome = "error"
+        timing = {}
+        try:
+            with metrics.llm_in_progress.labels(name).track_inprogress():
+                text = await llm.acomplete(
+                    prompt, cached=cached, validate=validate, timing=timing, **profile.get_params(model)
+                )
+            outcome = "ok"
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            metrics.llm_seconds.labels(name, model, outcome).observe(time.monotonic() - started)
+            if "upstream" in timing:
+                self.record(name, model, timing["upstream"])
+        return text
+
+    async def acomplete(self, name, prompt, cached=None, validate=None) -> str:
+        """
+        Complete with the chosen model; a primary call running over budget is
+        retried on the fallback. ``cached`` overrides the profile default,
+        ``validate`` keeps invalid completions out of the cache.
+        """
+        profile = self.profiles[name]
+        model = self.choose_model(name)
+        if model != profile.model or profile.fallback_model is None:
+            return await self.acomplete_with(name, model, prompt, cached, validate)
+        try:
+            return await asyncio.wait_for(
+                self.acomplete_with(name, model, prompt, cached, validate), profile.timeout
+            )
+        except asyncio.TimeoutError:
+            self.record(name, model, profile.timeout)
+            logger.warning("%s on %s is over its %ss timeout, falling back to %s",
+                           name, model, round(profile.timeout, 1), profile.fallback_model)
+            return await self.acomplete_with(name, profile.fallback_model, prompt, cached, validate)
+
+    async def astream(self, name, prompt):
+        """Stream from the chosen model; there is no fallback once the first delta is out."""
+        profile = self.profiles[name]
+        model = self.choose_model(name)
+        started = time.monotonic()
+        outcome = "error"
+        try:
+            with metrics.llm_in_progress.labels(name).track_inprogress():
+                async for chunk in llm.astream(prompt, cached=profile.cached, **profile.get_params(model)):
+                    yield chunk
+            outcome = "ok"
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            raise
+        finally:
+            metrics.llm_seconds.labels(name, model, outcome).observe(time.monotonic() - started)
+        self.record(name, model, time.monotonic() - started)
+
+    def get_stats(self) -> dict:
+        return {
+            f"{name}/{model}": {
+                "count": len(samples),
+                "p50": self.get_percentile(name, model, 0.5),
+                "p95": self.get_percentile(name, model, 0.95),
+            }
+            for (name, model), samples in list(self.latencies.items())
+        }
+
+
+router = ModelRouter(PROFILES, probe_every=settings.LLM_ROUTER_PROBE_EVERY)
@@ -0,0 +1,133 @@
+import asyncio
+import contextlib
+import datetime
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from gpt_bot.models import FlowProcess, QuestionBankEntry, QuestionType
+from .llm import llm
+from .questions import agenerate_questions, get_question_prompt, normalize_specializations
+
+logger = logging.getLogger(__name__)
+
+# pg_try_advisory_lock key, every shard and process schedules its own refill
+REFILL_LOCK_ID = 0x71626E6B
+
+
+def take(question_type, specialization_key="") -> list:
+    """
+    Serve the least used question set for the key and count the usage.
+    Returns None when the bank has nothing for the key.
+    """
+    with transaction.atomic():
+        entry = (
+            QuestionBankEntry.objects.select_for_update(skip_locked=True)
+            .filter(
+                question_type=question_type,
+                specialization_key=specialization_key,
+                used__lt=settings.QUESTION_BANK_MAX_USES,
+            )
+            .order_by("used", F("last_used_at").asc(nulls_first=True), "id")
+            .first()
+        )
+        if entry is None:
+            return None
+        QuestionBankEntry.objects.filter(id=entry.id).update(used=F("used") + 1, last_used_at=timezone.now())
+    return entry.questions
+
+
+def get_refill_keys() -> set:
+    """The shared keys and the specialization keys of processes started within the key window."""
+    keys = {(QuestionType.iq_test, ""), (QuestionType.soft_skill, "")}
+    since = timezone.now() - datetime.timedelta(days=settings.QUESTION_BANK_KEY_WINDOW_DAYS)
+    for process in FlowProcess.objects.filter(created_at__gte=since).prefetch_related("specialization"):
+        key = normalize_specializations([s.id for s in process.specialization.all()])
+        if key:
+            keys.add((QuestionType.professional_test, key))
+    return keys
+
+
+def evict_stale(keys) -> int:
+    """Delete the sets of keys that are no longer refilled."""
+    stale = QuestionBankEntry.objects.all()
+    for question_type in QuestionType.values:
+        stale = stale.exclude(
+            question_type=question_type,
+            specialization_key__in=[key for key_type, key in keys if key_type == question_type],
+        )
+    deleted, _ = stale.delete()
+    return deleted
+
+
+@contextlib.contextmanager
+def refill_lock():
+    """
+    Session level advisory lock around a refill, yields False when another process holds it.
+    Without Postgres (the bench and test settings) there is nothing to lock and it always yields True.
+    """
+    if connection.vendor != "postgresql":
+        yield True
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", [REFILL_LOCK_ID])
+        locked = cursor.fetchone()[0]
+    try:
+        yield locked
+    finally:
+        if locked:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [REFILL_LOCK_ID])
+
+
+def evict() -> int:
+    expired_at = timezone.now() - datetime.timedelta(days=settings.QUESTION_BANK_MAX_AGE_DAYS)
+    deleted, _ = QuestionBankEntry.objects.filter(
+        Q(used__gte=settings.QUESTION_BANK_MAX_USES) | Q(created_at__lt=expired_at)
+    ).delete()
+    return deleted
+
+
+async def generate_many(question_type, prompts):
+    # never cached, the bank needs distinct sets
+    return await asyncio.gather(
+        *[agenerate_questions(question_type, prompt, cached=False) for prompt in prompts], return_exceptions=True
+    )
+
+
+def refill() -> int:
+    """Evict worn out and stale sets and top up every key that fell below the low watermark."""
+    with refill_lock() as locked:
+        if not locked:
+            logger.info("question bank refill already running elsewhere, skipped")
+            return 0
+        return _refill()
+
+
+def _refill() -> int:
+    keys = get_refill_keys()
+    evicted = evict() + evict_stale(keys)
+    missing = {}
+    for question_type, key in keys:
+        available = QuestionBankEntry.objects.filter(
+            question_type=question_type, specialization_key=key, used__lt=settings.QUESTION_BANK_MAX_USES
+        ).count()
+        if available < settings.QUESTION_BANK_LOW_WATERMARK:
+            missing[(question_type, key)] = settings.QUESTION_BANK_TARGET_SIZE - available
+    created = 0
+    for (question_type, key), count in missing.items():
+        prompt = get_question_prompt(question_type, key)
+        entries = []
+        for questions in llm.run(generate_many(question_type, [prompt] * count)):
+            if isinstance(questions, Exception):
+                logger.warning("question bank generation for %s/%s failed: %r", question_type, key, questions)
+            elif questions:
+                entries.append(QuestionBankEntry(question_type=question_type, specialization_key=key,
+                                                 questions=questions))
+        QuestionBankEntry.objects.bulk_create(entries)
+        created += len(entries)
+    logger.info("question bank refill: %s evicted, %s created", evicted, created)
+    return created
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+import uuid
+
+from django.conf import settings
+
+from gpt_bot import metrics
+from .llm import llm
+from .questions import astream_questions, get_question_prompt
+from .state_store import state_store, update as update_state
+
+logger = logging.getLogger(__name__)
+
+_streams = {}
+
+
+class StreamSuperseded(Exception):
+    """The question state no longer belongs to the stream, e.g. the stage was cancelled or restarted."""
+
+
+async def stream_into_state(state_key, question_type, prompt, first_question):
+    """
+    Write the question state as soon as the first line is parsed and resolve
+    ``first_question``; the remaining lines are appended as they arrive.
+    The state carries the token of the stream, later writes are skipped once it changed.
+    """
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    ttl = settings.CONV_STATE_TTL
+    token = uuid.uuid4().hex
+
+    def owned(func):
+        def change(data):
+            if data.get("stream") != token:
+                raise StreamSuperseded(state_key)
+            return func(data)
+        return change
+
+    def append_question(question):
+        return owned(lambda data: {"questions": data.get("questions", []) + [question]})
+
+    try:
+        async for question in astream_questions(question_type, prompt):
+            if not first_question.done():
+                await loop.run_in_executor(None, lambda: state_store.replace(state_key, {
+                    "questions": [question], "index": 0, "question_type": question_type, "complete": False,
+                    "stream": token,
+                }, ttl=ttl))
+                metrics.first_question_seconds.labels(question_type).observe(time.monotonic() - started)
+                logger.info("time to first %s question: %.3fs", question_type, time.monotonic() - started)
+                first_question.set_result(question)
+            else:
+                await loop.run_in_executor(None, update_state, state_store, state_key, append_question(question), ttl)
+    except StreamSuperseded:
+        logger.info("question stream for %s superseded", state_key)
+        return
+    except Exception as e:
+        if not first_question.done():
+            first_question.set_exception(e)
+            return
+        logger.exception("question stream for %s broke off", state_key)
+    if not first_question.done():
+        first_question.set_exception(ValueError("no questions in the completion"))
+        return
+    try:
+        await loop.run_in_executor(None, update_state, state_store, state_key, owned(lambda data: {"complete": True}), ttl)
+    except StreamSuperseded:
+        logger.info("question stream for %s superseded", state_key)
+
+
+def start(state_key, question_type, specialization_key="") -> str:
+    """Start streaming a question set into ``state_key`` and return its first question."""
+    prompt = get_question_prompt(question_type, specialization_key)
+
+    async def run():
+        first_question = asyncio.get_running_loop().create_future()
+        task = asyncio.ensure_future(stream_into_state(state_key, question_type, prompt, first_question))
+        previous = _streams.pop(state_key, None)
+        if previous is not None:
+            previous.cancel()
+        _streams[state_key] = task
+        task.add_done_callback(lambda t: _forget(state_key, t, first_question))
+        return await first_question
+
+    return llm.run(run())
+
+
+def _forget(state_key, task, first_question):
+    if not first_question.done():
+        # cancelled before the first line arrived
+        first_question.cancel()
+    if _streams.get(state_key) is task:
+        del _streams[state_key]
+
+
+def cancel(state_key):
+    """Stop the question stream writing into ``state_key``, if any."""
+
+    def cancel_stream():
+        task = _streams.pop(state_key, None)
+        if task is not None:
+            task.cancel()
+
+    llm.loop.call_soon_threadsafe(cancel_stream)
+
+
+def wait_for_question(state_key, index) -> dict:
+    """Question state once question ``index`` has arrived or the stream is complete."""
+    deadline = time.monotonic() + settings.QUESTION_STREAM_WAIT_TIMEOUT
+    data = state_store.get(state_key)
+    while len(data.get("questions", [])) <= index and not data.get("complete", True):
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(0.2)
+        data = state_store.get(state_key)
+    return data
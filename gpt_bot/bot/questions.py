@@ -0,0 +1,56 @@
+from gpt_bot.models import Specialization, QuestionType
+from .llm import llm
+from .prompts import router
+
+QUESTION_PROFILES = {
+    QuestionType.iq_test: "iq_generation",
+    QuestionType.soft_skill: "soft_skill_generation",
+    QuestionType.professional_test: "tech_generation",
+}
+
+
+def normalize_specializations(categories) -> str:
+    """Canonical key for a set of Specialization ids: sorted, deduplicated, comma separated."""
+    return ",".join(str(c) for c in sorted({int(c) for c in categories or ()}))
+
+
+def split_questions(text) -> list:
+    questions = []
+    for q in text.split("\n"):
+        if q.strip():
+            questions.append(q)
+    return questions
+
+
+def get_question_prompt(question_type, specialization_key="") -> str:
+    if question_type == QuestionType.iq_test:
+        return "Give 10 questions for testing my IQ. Question in russian."
+    if question_type == QuestionType.soft_skill:
+        return (
+            "Сформулируйте 10 вопрос, связанный с софт-навыком <<коммуникация>>, <<руководство>>,"
+            "<<решение проблем>>, <<адаптивность>>."
+        )
+    ids = specialization_key.split(",") if specialization_key else []
+    techs = [f"<<{name}>>" for name in Specialization.objects.filter(id__in=ids).values_list("name", flat=True)]
+    return "Сформулируйте 10 вопрос, связанный с технологиями " + ", ".join(techs) + "."
+
+
+async def agenerate_questions(question_type, prompt, cached=None) -> list:
+    return split_questions(await router.acomplete(QUESTION_PROFILES[question_type], prompt, cached=cached))
+
+
+def generate_questions(question_type, specialization_key="") -> list:
+    return llm.run(agenerate_questions(question_type, get_question_prompt(question_type, specialization_key)))
+
+
+async def astream_questions(question_type, prompt):
+    """Yield question lines one at a time as the completion streams in."""
+    buffer = ""
+    async for chunk in router.astream(QUESTION_PROFILES[question_type], prompt):
+        buffer += chunk
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
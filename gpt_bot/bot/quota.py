@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.db.models import F
+
+from gpt_bot import metrics
+from gpt_bot.models import UserLimit, normalize_phone_number
+from .state_store import state_store
+
+
+def get_denied_cache_key(phone_number) -> str:
+    return f"user_limit_denied_{phone_number}"
+
+
+def consume(phone_number) -> bool:
+    """
+    Take one test attempt of the number's UserLimit. A single conditional UPDATE, so concurrent
+    attempts can not overdraw the limit; numbers without attempts left are cached for a short while,
+    in the state store so that a limit raised in the admin clears it for every bot process.
+    """
+    phone_number = normalize_phone_number(phone_number)
+    if state_store.get_field(get_denied_cache_key(phone_number), "denied"):
+        metrics.quota_checks.labels("denied_cached").inc()
+        return False
+    consumed = UserLimit.objects.filter(phone_number=phone_number, used__lt=F("limit")).update(used=F("used") + 1)
+    if not consumed:
+        state_store.set_fields(
+            get_denied_cache_key(phone_number), {"denied": True}, ttl=settings.USER_LIMIT_DENIED_TTL
+        )
+    metrics.quota_checks.labels("consumed" if consumed else "denied").inc()
+    return bool(consumed)
+
+
+def invalidate(phone_number):
+    state_store.delete(get_denied_cache_key(normalize_phone_number(phone_number)))
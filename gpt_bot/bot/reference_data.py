@@ -0,0 +1,104 @@
+import threading
+import time
+
+from django.conf import settings
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from gpt_bot.models import Region, Specialization
+from .state_store import state_store
+
+VERSION_KEY = "reference_data_version"
+
+
+def get_rows(items, row_size=2) -> list:
+    rows = [[]]
+    for item in items:
+        if len(rows[-1]) < row_size:
+            rows[-1].append(item)
+        else:
+            rows.append([item])
+    return rows
+
+
+class ReferenceData:
+    """
+    Regions and specializations with prebuilt keyboards. Reloaded when the shared
+    version key is bumped by the model signals, or after ``max_age`` seconds.
+    """
+
+    def __init__(self, check_interval=30, max_age=600):
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self.version = None
+        self.loaded_at = 0
+        self.checked_at = 0
+        self.region_names = {}
+        self.regions_board = None
+        self.category_rows = []
+        self._lock = threading.Lock()
+
+    def load(self, version):
+        regions = list(Region.objects.values_list("id", "name"))
+        specializations = list(Specialization.objects.values_list("id", "name"))
+        self.region_names = {str(region_id): name for region_id, name in regions}
+        self.regions_board = InlineKeyboardMarkup(
+            get_rows([InlineKeyboardButton(name, callback_data=str(region_id)) for region_id, name in regions])
+        )
+        self.category_rows = get_rows(
+            [InlineKeyboardButton(name, callback_data=str(c_id)) for c_id, name in specializations] +
+            [InlineKeyboardButton("Сохранить", callback_data="save")]
+        )
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+    def refresh(self):
+        now = time.monotonic()
+        if self.version is not None and now - self.checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self.version is not None and now - self.checked_at < self.check_interval:
+                return
+            version = state_store.get_field(VERSION_KEY, "version", 0)
+            if version != self.version or now - self.loaded_at > self.max_age:
+                self.load(version)
+            self.checked_at = now
+
+    def get_regions_board(self) -> InlineKeyboardMarkup:
+        self.refresh()
+        return self.regions_board
+
+    def get_region_name(self, region_id) -> str:
+        self.refresh()
+        name = self.region_names.get(str(region_id))
+        if name is None:
+            name = Region.objects.get(id=region_id).name
+        return name
+
+    def get_category_board(self, selected_categories=None) -> InlineKeyboardMarkup:
+        self.refresh()
+        selected = set(selected_categories or [])
+        if not selected:
+            return InlineKeyboardMarkup(self.category_rows)
+        return InlineKeyboardMarkup([
+            [
+                InlineKeyboardButton(f"✅{button.text}", callback_data=button.callback_data)
+                if button.callback_data in selected else button
+                for button in row
+            ]
+            for row in self.category_rows
+        ])
+
+
+def invalidate():
+    """
+    Bump the shared version so every process reloads on its next check. It lives in the state store,
+    which the admin and bot processes share when CONV_STATE_URL is redis://.
+    """
+    state_store.increment(VERSION_KEY, "version")
+    reference_data.checked_at = 0
+
+
+reference_data = ReferenceData(
+    check_interval=settings.REFERENCE_DATA_CHECK_INTERVAL,
+    max_age=settings.REFERENCE_DATA_MAX_AGE,
+)
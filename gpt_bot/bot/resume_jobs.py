@@ -0,0 +1,187 @@
+import asyncio
+import datetime
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import django
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from gpt_bot import metrics
+from gpt_bot.models import FlowProcess, ResumeJob, ResumeJobStatus
+from .analysis import aanalyze_answers
+from .llm import llm
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(process_id, chat_id) -> ResumeJob:
+    """Idempotent per FlowProcess: a second call returns the existing job, re-queueing it only if it failed."""
+    job, created = ResumeJob.objects.get_or_create(process_id=process_id, defaults={"chat_id": chat_id})
+    if not created and job.status == ResumeJobStatus.failed:
+        ResumeJob.objects.filter(id=job.id).update(
+            status=ResumeJobStatus.pending, attempts=0, run_after=timezone.now(), error=None
+        )
+    return job
+
+
+def render_resume(process_id) -> float:
+    """
+    Runs in a render worker process: render the PDF of an analysed FlowProcess.
+    Returns the render time, the worker's own metrics are never scraped.
+    """
+    return FlowProcess.objects.get(id=process_id).generate_resume()
+
+
+def is_analyzed(process_id) -> bool:
+    return FlowProcess.objects.filter(id=process_id, analysis_timings__isnull=False).exists()
+
+
+class ResumeRenderPool:
+    """
+    Claims pending ResumeJob rows, analyses the answers on the LLM client loop of this process, where the
+    shared rate limits and circuit breaker apply, and renders the PDFs in a pool of worker processes.
+    Up to ``max_in_flight`` jobs are analysed or rendered at once, ``workers`` of them rendering.
+    ``on_done(job, process)`` and ``on_failed(job)`` are called once a job finishes for good.
+
+    A running job is leased to the bot process rendering it: its ``updated_at`` is renewed while it runs,
+    and a job whose lease ran out, because that process died, is put back to pending by any process.
+    """
+
+    def __init__(self, on_done, on_failed, workers=2, max_in_flight=20):
+        self.on_done = on_done
+        self.on_failed = on_failed
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.in_flight = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._renewed_at = 0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                # not a function of this module: unpickling it would import the models before setup
+                initializer=django.setup,
+            )
+        return self._executor
+
+    def recover(self):
+        """Jobs left running by a bot process that stopped renewing their lease are picked up again."""
+        expired = timezone.now() - datetime.timedelta(seconds=settings.RESUME_JOB_LEASE)
+        ResumeJob.objects.filter(status=ResumeJobStatus.running, updated_at__lt=expired).update(
+            status=ResumeJobStatus.pending
+        )
+
+    def renew(self):
+        """Renew the leases of the jobs rendered here, a few times per lease."""
+        if time.monotonic() - self._renewed_at < settings.RESUME_JOB_LEASE / 3:
+            return
+        self._renewed_at = time.monotonic()
+        with self._lock:
+            in_flight = list(self.in_flight)
+        if in_flight:
+            ResumeJob.objects.filter(id__in=in_flight, status=ResumeJobStatus.running).update(
+                updated_at=timezone.now()
+            )
+        self.recover()
+
+    def claim(self, limit) -> list:
+        with transaction.atomic():
+            jobs = list(
+                ResumeJob.objects.select_for_update(skip_locked=True)
+                .filter(status=ResumeJobStatus.pending, run_after__lte=timezone.now())
+                .exclude(id__in=self.in_flight)
+                .order_by("created_at")[:limit]
+            )
+            now = timezone.now()
+            for job in jobs:
+                job.status = ResumeJobStatus.running
+                job.attempts += 1
+                job.updated_at = now
+            # bulk_update does not touch auto_now fields, the lease starts here
+            ResumeJob.objects.bulk_update(jobs, ["status", "attempts", "updated_at"])
+        return jobs
+
+    def poll(self):
+        self.renew()
+        with self._lock:
+            free = self.max_in_flight - len(self.in_flight)
+            if free <= 0:
+                return
+            jobs = self.claim(free)
+            self.in_flight.update(job.id for job in jobs)
+        for job in jobs:
+            llm.submit(self.run(job)).add_done_callback(partial(self.report, job))
+
+    async def run(self, job):
+        # the ORM refuses to run on the loop thread, database work goes to the executor
+        loop = asyncio.get_running_loop()
+        try:
+            if not await loop.run_in_executor(None, is_analyzed, job.process_id):
+                await aanalyze_answers(job.process_id)
+            await self.render(job)
+        except Exception as e:
+            logger.exception("resume job %s failed (attempt %s)", job.id, job.attempts)
+            await loop.run_in_executor(None, self.retry_or_fail, job, e)
+        else:
+            await loop.run_in_executor(None, self.finished, job)
+        finally:
+            with self._lock:
+                self.in_flight.discard(job.id)
+
+    async def render(self, job):
+        started = time.monotonic()
+        future = await asyncio.get_running_loop().run_in_executor(None, self.submit, job)
+        outcome = "error"
+        with metrics.resume_renders_in_progress.track_inprogress():
+            try:
+                metrics.resume_render_seconds.observe(await asyncio.wrap_future(future))
+                outcome = "ok"
+            finally:
+                metrics.resume_job_seconds.labels(outcome).observe(time.monotonic() - started)
+
+    def submit(self, job):
+        try:
+            return self.executor.submit(render_resume, job.process_id)
+        except BrokenProcessPool:
+            # a worker died, e.g. killed for memory; its jobs were failed already, start a fresh pool
+            self._executor = None
+            return self.executor.submit(render_resume, job.process_id)
+
+    def finished(self, job):
+        ResumeJob.objects.filter(id=job.id).update(status=ResumeJobStatus.done, error=None)
+        try:
+            self.on_done(job, FlowProcess.objects.get(id=job.process_id))
+        except Exception:
+            logger.exception("resume job %s completion callback failed", job.id)
+
+    @staticmethod
+    def report(job, future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("resume job %s stopped: %r", job.id, future.exception())
+
+    def retry_or_fail(self, job, error):
+        if job.attempts < settings.RESUME_JOB_MAX_ATTEMPTS:
+            delay = settings.RESUME_JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            ResumeJob.objects.filter(id=job.id).update(
+                status=ResumeJobStatus.pending,
+                run_after=timezone.now() + datetime.timedelta(seconds=delay),
+                error=repr(error),
+            )
+            return
+        ResumeJob.objects.filter(id=job.id).update(status=ResumeJobStatus.failed, error=repr(error))
+        self.on_failed(job)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
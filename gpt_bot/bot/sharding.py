@@ -0,0 +1,196 @@
+import bisect
+import functools
+import hashlib
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from django.conf import settings
+from telegram.update import Update
+
+logger = logging.getLogger(__name__)
+
+
+class HashRing:
+    """Consistent hash ring mapping chat ids to shard numbers."""
+
+    def __init__(self, shards, replicas=100):
+        self.shards = shards
+        self.ring = sorted(
+            (self.hash(f"shard-{shard}-{replica}"), shard) for shard in range(shards) for replica in range(replicas)
+        )
+        self.keys = [key for key, _ in self.ring]
+
+    @staticmethod
+    def hash(value) -> int:
+        return int(hashlib.md5(str(value).encode()).hexdigest()[:16], 16)
+
+    def get_shard(self, chat_id) -> int:
+        index = bisect.bisect(self.keys, self.hash(chat_id)) % len(self.ring)
+        return self.ring[index][1]
+
+
+class MemoryUpdateQueue:
+    """In-process stand-in, shards are plain queues."""
+
+    def __init__(self):
+        self.queues = {}
+        self._lock = threading.Lock()
+
+    def get_queue(self, shard) -> queue.Queue:
+        with self._lock:
+            return self.queues.setdefault(shard, queue.Queue())
+
+    def put(self, shard, payload: dict):
+        self.get_queue(shard).put(payload)
+
+    def get(self, shard, timeout=1.0):
+        try:
+            return None, self.get_queue(shard).get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def ack(self, shard, token):
+        pass
+
+    def recover(self, shard):
+        pass
+
+
+class SQLiteUpdateQueue:
+    """Local multi-process stand-in: one table, rows are deleted once the worker acknowledges them."""
+
+    def __init__(self, path, poll_interval=0.05):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.read_ids = {}  # shard -> last row handed out; rows stay in the table until acknowledged
+        self._local = threading.local()
+        self.connection.executescript(
+            "PRAGMA journal_mode=WAL;"
+            "CREATE TABLE IF NOT EXISTS updates ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, shard INTEGER NOT NULL, payload TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS updates_shard_id ON updates (shard, id);"
+        )
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if getattr(self._local, "connection", None) is None:
+            self._local.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return self._local.connection
+
+    def put(self, shard, payload: dict):
+        self.connection.execute("INSERT INTO updates (shard, payload) VALUES (?, ?)", (shard, json.dumps(payload)))
+
+    def get(self, shard, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            row = self.connection.execute(
+                "SELECT id, payload FROM updates WHERE shard = ? AND id > ? ORDER BY id LIMIT 1",
+                (shard, self.read_ids.get(shard, 0)),
+            ).fetchone()
+            if row is not None:
+                self.read_ids[shard] = row[0]
+                return row[0], json.loads(row[1])
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def ack(self, shard, token):
+        self.connection.execute("DELETE FROM updates WHERE id = ?", (token,))
+
+    def recover(self, shard):
+        # unacknowledged rows stay at the head of the shard and are read again
+        self.read_ids.pop(shard, None)
+
+
+class RedisUpdateQueue:
+    """Reliable list queue: items move to a per-shard processing list until acknowledged."""
+
+    def __init__(self, url, prefix="bot_updates"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get_keys(self, shard):
+        return f"{self.prefix}:{shard}", f"{self.prefix}:{shard}:processing"
+
+    def put(self, shard, payload: dict):
+        self.client.lpush(self.get_keys(shard)[0], json.dumps(payload))
+
+    def get(self, shard, timeout=1.0):
+        pending, processing = self.get_keys(shard)
+        raw = self.client.brpoplpush(pending, processing, timeout=max(1, int(timeout)))
+        if raw is None:
+            return None
+        return raw, json.loads(raw)
+
+    def ack(self, shard, token):
+        self.client.lrem(self.get_keys(shard)[1], 1, token)
+
+    def recover(self, shard):
+        """Put updates a crashed worker was processing back at the head of the shard."""
+        pending, processing = self.get_keys(shard)
+        # ``get`` takes from the right; moving the newest (leftmost) first leaves the oldest rightmost
+        while self.client.lmove(processing, pending, "LEFT", "RIGHT") is not None:
+            pass
+
+
+def get_update_queue(url=None):
+    url = url or settings.SHARD_QUEUE_URL
+    parsed = urlparse(url)
+    if parsed.scheme == "memory":
+        return MemoryUpdateQueue()
+    if parsed.scheme == "sqlite":
+        return SQLiteUpdateQueue(parsed.path)
+    if parsed.scheme in ("redis", "rediss"):
+        return RedisUpdateQueue(url)
+    raise ValueError(f"unsupported shard queue url: {url}")
+
+
+def get_chat_id(update: Update) -> int:
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return 0
+
+
+def run_ingest(bot, update_queue, shards, poll_timeout=30):
+    """Long-poll Telegram and route every update to the shard owning its chat."""
+    ring = HashRing(shards)
+    bot.delete_webhook()
+    offset = None
+    while True:
+        try:
+            updates = bot.get_updates(offset=offset, timeout=poll_timeout)
+        except Exception:
+            logger.exception("getUpdates failed")
+            time.sleep(1)
+            continue
+        for update in updates:
+            update_queue.put(ring.get_shard(get_chat_id(update)), update.to_dict())
+            offset = update.update_id + 1
+
+
+def run_worker(dispatcher, update_queue, shard):
+    """
+    Feed the shard's updates to the chat scheduler, which keeps them in order per chat; an update is
+    acknowledged once handled, so a crash replays whatever was still queued in the process.
+    """
+    update_queue.recover(shard)
+    while True:
+        item = update_queue.get(shard)
+        if item is None:
+            continue
+        token, payload = item
+        try:
+            dispatcher.schedule_update(Update.de_json(payload, dispatcher.bot),
+                                       done=functools.partial(update_queue.ack, shard, token))
+        except Exception:
+            logger.exception("shard %s failed to process update %s", shard, payload.get("update_id"))
+            update_queue.ack(shard, token)
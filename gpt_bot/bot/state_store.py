@@ -0,0 +1,267 @@
+import copy
+import json
+import pickle
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+from django.conf import settings
+from telegram.ext import BasePersistence
+
+VERSION_FIELD = "__version__"
+
+
+class StateConflict(Exception):
+    pass
+
+
+class MemoryStateStore:
+    """In-process stand-in with the same semantics as the Redis store."""
+
+    def __init__(self, sweep_every=1000):
+        self._data = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.sweep_every = sweep_every
+
+    def _load(self, key):
+        item = self._data.get(key)
+        if item is not None and item["expires_at"] is not None and item["expires_at"] < time.monotonic():
+            del self._data[key]
+            return None
+        return item
+
+    def _write(self, key, fields, ttl, replace=False):
+        item = self._load(key)
+        if item is None or replace:
+            item = {"version": item["version"] if item else 0, "fields": {}}
+        item["fields"].update(copy.deepcopy(fields))
+        item["version"] += 1
+        item["expires_at"] = time.monotonic() + ttl if ttl else None
+        self._data[key] = item
+        self._writes += 1
+        if self._writes % self.sweep_every == 0:
+            self._sweep()
+        return item
+
+    def _sweep(self):
+        # expired keys are otherwise only dropped when read again
+        now = time.monotonic()
+        for key in [key for key, item in self._data.items() if item["expires_at"] is not None
+                    and item["expires_at"] < now]:
+            del self._data[key]
+
+    def get_versioned(self, key):
+        with self._lock:
+            item = self._load(key)
+            if item is None:
+                return 0, {}
+            return item["version"], copy.deepcopy(item["fields"])
+
+    def get(self, key) -> dict:
+        return self.get_versioned(key)[1]
+
+    def get_field(self, key, field, default=None):
+        return self.get(key).get(field, default)
+
+    def set_fields(self, key, fields: dict, ttl=None):
+        with self._lock:
+            self._write(key, fields, ttl)
+
+    def replace(self, key, fields: dict, ttl=None):
+        with self._lock:
+            self._write(key, fields, ttl, replace=True)
+
+    def compare_and_set(self, key, version, fields: dict, ttl=None) -> bool:
+        with self._lock:
+            item = self._load(key)
+            if (item["version"] if item else 0) != version:
+                return False
+            self._write(key, fields, ttl)
+            return True
+
+    def increment(self, key, field, amount=1, ttl=None) -> int:
+        with self._lock:
+            item = self._load(key)
+            value = (item["fields"].get(field, 0) if item else 0) + amount
+            self._write(key, {field: value}, ttl)
+            return value
+
+    def delete_fields(self, key, *fields):
+        with self._lock:
+            item = self._load(key)
+            if item is not None:
+                for field in fields:
+                    item["fields"].pop(field, None)
+                item["version"] += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def touch(self, key, ttl):
+        with self._lock:
+            item = self._load(key)
+            if item is not None:
+                item["expires_at"] = time.monotonic() + ttl
+
+
+class RedisStateStore:
+    """
+    Every state is a Redis hash: one pickled value per field plus a version
+    counter bumped by every write, used for optimistic concurrency.
+    """
+
+    def __init__(self, url, prefix="conv_state"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def make_key(self, key) -> str:
+        return f"{self.prefix}:{key}"
+
+    @staticmethod
+    def decode(raw: dict):
+        version = int(raw.pop(VERSION_FIELD.encode(), 0))
+        return version, {k.decode(): pickle.loads(v) for k, v in raw.items()}
+
+    def get_versioned(self, key):
+        return self.decode(self.client.hgetall(self.make_key(key)))
+
+    def get(self, key) -> dict:
+        return self.get_versioned(key)[1]
+
+    def get_field(self, key, field, default=None):
+        raw = self.client.hget(self.make_key(key), field)
+        return default if raw is None else pickle.loads(raw)
+
+    def _write(self, pipe, key, fields, ttl):
+        if fields:
+            pipe.hset(key, mapping={k: pickle.dumps(v) for k, v in fields.items()})
+        pipe.hincrby(key, VERSION_FIELD, 1)
+        if ttl:
+            pipe.expire(key, ttl)
+
+    def set_fields(self, key, fields: dict, ttl=None):
+        pipe = self.client.pipeline()
+        self._write(pipe, self.make_key(key), fields, ttl)
+        pipe.execute()
+
+    def replace(self, key, fields: dict, ttl=None):
+        key = self.make_key(key)
+
+        def replace_fields(pipe):
+            version = int(pipe.hget(key, VERSION_FIELD) or 0)
+            pipe.multi()
+            pipe.delete(key)
+            pipe.hset(key, VERSION_FIELD, version)
+            self._write(pipe, key, fields, ttl)
+
+        self.client.transaction(replace_fields, key)
+
+    def compare_and_set(self, key, version, fields: dict, ttl=None) -> bool:
+        import redis
+
+        key = self.make_key(key)
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if int(pipe.hget(key, VERSION_FIELD) or 0) != version:
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                self._write(pipe, key, fields, ttl)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    def increment(self, key, field, amount=1, ttl=None) -> int:
+        # values are pickled, so a numeric counter goes through the optimistic path
+        for _ in range(10):
+            version, data = self.get_versioned(key)
+            value = data.get(field, 0) + amount
+            if self.compare_and_set(key, version, {field: value}, ttl):
+                return value
+        raise StateConflict(key)
+
+    def delete_fields(self, key, *fields):
+        pipe = self.client.pipeline()
+        pipe.hdel(self.make_key(key), *fields)
+        pipe.hincrby(self.make_key(key), VERSION_FIELD, 1)
+        pipe.execute()
+
+    def delete(self, key):
+        self.client.delete(self.make_key(key))
+
+    def touch(self, key, ttl):
+        self.client.expire(self.make_key(key), ttl)
+
+
+def update(store, key, func, ttl=None, retries=10) -> dict:
+    """
+    Optimistic read-modify-write: ``func(data)`` returns the fields to change and
+    is re-run on a fresh copy whenever another writer got in between.
+    """
+    for _ in range(retries):
+        version, data = store.get_versioned(key)
+        changes = func(data)
+        if store.compare_and_set(key, version, changes, ttl):
+            data.update(changes)
+            return data
+    raise StateConflict(key)
+
+
+def get_state_store(url=None):
+    url = url or settings.CONV_STATE_URL
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return MemoryStateStore()
+    if scheme in ("redis", "rediss"):
+        return RedisStateStore(url)
+    raise ValueError(f"unsupported conversation state url: {url}")
+
+
+class StatePersistence(BasePersistence):
+    """Keeps ConversationHandler states in the state store so restarts and other workers see them."""
+
+    def __init__(self, store):
+        super().__init__(store_user_data=False, store_chat_data=False, store_bot_data=False)
+        self.store = store
+
+    @staticmethod
+    def make_key(name) -> str:
+        return f"conversations_{name}"
+
+    def get_conversations(self, name):
+        return {tuple(json.loads(k)): v for k, v in self.store.get(self.make_key(name)).items()}
+
+    def update_conversation(self, name, key, new_state):
+        field = json.dumps(list(key))
+        if new_state is None:
+            self.store.delete_fields(self.make_key(name), field)
+        else:
+            self.store.set_fields(self.make_key(name), {field: new_state})
+
+    def get_user_data(self):
+        return defaultdict(dict)
+
+    def get_chat_data(self):
+        return defaultdict(dict)
+
+    def get_bot_data(self):
+        return {}
+
+    def update_user_data(self, user_id, data):
+        pass
+
+    def update_chat_data(self, chat_id, data):
+        pass
+
+    def update_bot_data(self, data):
+        pass
+
+
+state_store = get_state_store()
@@ -0,0 +1,73 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+
+from gpt_bot.models import TelegramUser
+
+logger = logging.getLogger(__name__)
+
+
+class UserRegistry:
+    """
+    LRU set of user ids already known to exist, plus a write-behind buffer of
+    new users and ``last_action_at`` touches flushed in bulk by ``flush``.
+    """
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.known = OrderedDict()
+        self.new_users = {}
+        self.unsaved = {}  # new users until a flush inserted them, including the ones a flush is inserting
+        self.touched = set()
+        self._lock = threading.Lock()
+
+    def touch(self, user_id, username=None):
+        with self._lock:
+            if user_id in self.known:
+                self.known.move_to_end(user_id)
+            else:
+                self.known[user_id] = True
+                if len(self.known) > self.max_size:
+                    self.known.popitem(last=False)
+                self.new_users[user_id] = username
+                self.unsaved[user_id] = username
+            self.touched.add(user_id)
+
+    def ensure_saved(self, user_id):
+        """Insert the user row right away when it is not saved yet, e.g. before a FK insert."""
+        with self._lock:
+            if user_id not in self.unsaved:
+                return
+            username = self.unsaved[user_id]
+        # a concurrent flush may have taken the row and not inserted it yet, insert it here as well
+        TelegramUser.objects.bulk_create([TelegramUser(user_id=user_id, username=username)], ignore_conflicts=True)
+        with self._lock:
+            self.unsaved.pop(user_id, None)
+
+    def flush(self):
+        with self._lock:
+            new_users, self.new_users = self.new_users, {}
+            touched, self.touched = self.touched - set(new_users), set()
+        try:
+            if new_users:
+                TelegramUser.objects.bulk_create(
+                    [TelegramUser(user_id=user_id, username=username) for user_id, username in new_users.items()],
+                    ignore_conflicts=True,
+                )
+            if touched:
+                TelegramUser.objects.filter(user_id__in=touched).update(last_action_at=timezone.now())
+            with self._lock:
+                for user_id in new_users:
+                    self.unsaved.pop(user_id, None)
+        except Exception:
+            logger.exception("user registry flush failed")
+            with self._lock:
+                for user_id, username in new_users.items():
+                    self.new_users.setdefault(user_id, username)
+                self.touched.update(touched)
+
+
+user_registry = UserRegistry(max_size=settings.USER_REGISTRY_SIZE)
@@ -0,0 +1,17 @@
+from telegram.update import Update
+
+# set by `run_bot --webhook`; any other process running the Django app refuses updates, so only one
+# process runs a dispatcher and holds the conversations
+enabled = False
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def enqueue_update(payload: dict):
+    # the bot is imported lazily so only the process serving the webhook builds it
+    from .main import updater
+
+    updater.update_queue.put(Update.de_json(payload, updater.bot))
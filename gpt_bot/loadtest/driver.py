@@ -0,0 +1,183 @@
+import asyncio
+import itertools
+import time
+from collections import defaultdict
+
+import aiohttp
+
+PROGRESS_PREFIXES = ("🔄", "📝")
+FAILURE_PREFIXES = ("👨‍💼К сожалению", "👨‍💼Сервис временно")
+# conversation states in flow order; "resume" is the answer that gets the PDF back
+STEPS = ("start", "contact", "full_name", "birth_date", "region", "gender", "cv", "category", "save", "answer",
+         "resume")
+
+
+class StepError(Exception):
+    pass
+
+
+def is_reply(event) -> bool:
+    """A message that answers the update, as opposed to progress notices and edits."""
+    if event["method"] == "sendDocument":
+        return True
+    return event["method"] == "sendMessage" and not event["params"].get("text", "").startswith(PROGRESS_PREFIXES)
+
+
+def is_edit(event) -> bool:
+    return event["method"] == "editMessageReplyMarkup"
+
+
+def get_buttons(message) -> list:
+    markup = message.get("reply_markup") or {}
+    return [button for row in markup.get("inline_keyboard", []) for button in row]
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.started = 0
+        self.completed = 0
+        self.updates = 0
+
+    @staticmethod
+    def get_percentile(samples, percentile) -> float:
+        return samples[min(len(samples) - 1, int(len(samples) * percentile))] if samples else 0
+
+    def get_report(self, seconds) -> dict:
+        steps = {}
+        for step in sorted(set(self.latencies) | set(self.errors), key=STEPS.index):
+            samples = sorted(self.latencies[step])
+            total = len(samples) + self.errors[step]
+            steps[step] = {
+                "count": len(samples),
+                "p50": round(self.get_percentile(samples, 0.5), 3),
+                "p95": round(self.get_percentile(samples, 0.95), 3),
+                "p99": round(self.get_percentile(samples, 0.99), 3),
+                "max": round(samples[-1], 3) if samples else 0,
+                "errors": self.errors[step],
+                "error_rate": round(self.errors[step] / total, 4) if total else 0,
+            }
+        return {
+            "seconds": round(seconds, 1),
+            "candidates": self.started,
+            "completed": self.completed,
+            "failed": self.started - self.completed,
+            "candidates_per_minute": round(self.completed / seconds * 60, 2) if seconds else 0,
+            "updates_per_second": round(self.updates / seconds, 2) if seconds else 0,
+            "steps": steps,
+        }
+
+
+class VirtualCandidate:
+    """Walks the whole conversation as one Telegram user through the fake Bot API."""
+
+    def __init__(self, session, api_url, chat_id, stats, step_timeout=60, resume_timeout=300, max_answers=60):
+        self.session = session
+        self.api_url = api_url.rstrip("/")
+        self.chat_id = chat_id
+        self.stats = stats
+        self.step_timeout = step_timeout
+        self.resume_timeout = resume_timeout
+        self.max_answers = max_answers
+        self.last_event_id = 0
+        self.message_ids = itertools.count(1)
+        self.user = {"id": chat_id, "is_bot": False, "first_name": "Candidate", "username": f"candidate_{chat_id}"}
+
+    @property
+    def phone_number(self) -> str:
+        return f"+99890{self.chat_id % 10 ** 7:07d}"
+
+    def get_message(self, **fields) -> dict:
+        return {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "from": self.user,
+            "chat": {"id": self.chat_id, "type": "private", "first_name": "Candidate"},
+            **fields,
+        }
+
+    def get_callback(self, message, data) -> dict:
+        return {"callback_query": {
+            "id": f"{self.chat_id}-{next(self.message_ids)}",
+            "from": self.user,
+            "message": message,
+            "chat_instance": str(self.chat_id),
+            "data": data,
+        }}
+
+    async def send(self, update):
+        async with self.session.post(f"{self.api_url}/loadtest/updates", json=update) as response:
+            response.raise_for_status()
+        self.stats.updates += 1
+
+    async def wait_for(self, predicate, timeout) -> dict:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            params = {"chat_id": self.chat_id, "after": self.last_event_id,
+                      "timeout": min(30, max(0.1, deadline - time.monotonic()))}
+            async with self.session.get(f"{self.api_url}/loadtest/events", params=params) as response:
+                events = (await response.json())["result"]
+            for event in events:
+                self.last_event_id = event["id"]
+                if event["params"].get("text", "").startswith(FAILURE_PREFIXES):
+                    raise StepError(event["params"]["text"])
+                if predicate(event):
+                    return event
+        raise StepError("timed out")
+
+    async def step(self, name, update, predicate=is_reply, timeout=None) -> dict:
+        started = time.monotonic()
+        try:
+            await self.send(update)
+            event = await self.wait_for(predicate, timeout or self.step_timeout)
+        except (StepError, aiohttp.ClientError, asyncio.TimeoutError):
+            self.stats.errors[name] += 1
+            raise
+        if event["method"] == "sendDocument":
+            name = "resume"
+        self.stats.latencies[name].append(time.monotonic() - started)
+        return event
+
+    async def run(self):
+        self.stats.started += 1
+        try:
+            await self.step("start", {"message": self.get_message(
+                text="/start", entities=[{"offset": 0, "length": 6, "type": "bot_command"}])})
+            await self.step("contact", {"message": self.get_message(contact={
+                "phone_number": self.phone_number, "first_name": "Candidate", "user_id": self.chat_id})})
+            await self.step("full_name", {"message": self.get_message(text=f"Candidate {self.chat_id}")})
+            regions = await self.step("birth_date", {"message": self.get_message(text="01.01.1995")})
+            region = get_buttons(regions["message"])[0]["callback_data"]
+            await self.step("region", self.get_callback(regions["message"], region))
+            await self.step("gender", {"message": self.get_message(text="Мужской")})
+            categories = await self.step("cv", {"message": self.get_message(document={
+                "file_id": f"cv-{self.chat_id}", "file_unique_id": f"cv-{self.chat_id}",
+                "file_name": "cv.pdf", "mime_type": "application/pdf"})})
+            category = get_buttons(categories["message"])[0]["callback_data"]
+            await self.step("category", self.get_callback(categories["message"], category), predicate=is_edit)
+            await self.step("save", self.get_callback(categories["message"], "save"))
+            for i in range(self.max_answers):
+                event = await self.step("answer", {"message": self.get_message(text=f"Ответ {i + 1}")},
+                                        timeout=self.resume_timeout)
+                if event["method"] == "sendDocument":
+                    self.stats.completed += 1
+                    return
+            self.stats.errors["resume"] += 1
+        except (StepError, aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+
+
+async def run_load(api_url, candidates, ramp=0, chat_id_base=7000000, **options) -> dict:
+    """Run ``candidates`` virtual candidates, starting them evenly over ``ramp`` seconds."""
+    stats = LoadStats()
+    started = time.monotonic()
+    # every candidate keeps an events long-poll open, so the pool is unbounded
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=None)) as session:
+        async def run_candidate(i):
+            await asyncio.sleep(ramp * i / candidates)
+            await VirtualCandidate(session, api_url, chat_id_base + i, stats, **options).run()
+
+        await asyncio.gather(*[run_candidate(i) for i in range(candidates)])
+    return stats.get_report(time.monotonic() - started)
@@ -0,0 +1,129 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict
+
+from aiohttp import web
+
+BOT_METHODS_WITH_MESSAGE = {"sendMessage", "sendDocument", "editMessageText", "editMessageReplyMarkup"}
+
+
+class FakeBotAPI:
+    """
+    In-memory Telegram Bot API for load tests. The bot talks to it as usual
+    (``getUpdates``, ``sendMessage``, ...); the driver injects updates with
+    ``POST /loadtest/updates`` and long-polls ``GET /loadtest/events`` for
+    what the bot sent to a chat.
+    """
+
+    def __init__(self):
+        self.updates = []
+        # ids of a restarted fake API must not repeat those of earlier runs, the bot drops seen update ids
+        self.update_ids = itertools.count(int(time.time()) * 10 ** 6)
+        self.message_ids = itertools.count(1)
+        self.file_ids = itertools.count(1)
+        self.events = defaultdict(list)
+        self.event_ids = itertools.count(1)
+        self.new_update = asyncio.Event()
+        self.new_event = defaultdict(asyncio.Event)
+        self.bot_user = {"id": 1, "is_bot": True, "first_name": "Load test bot", "username": "loadtest_bot"}
+
+    def get_app(self) -> web.Application:
+        app = web.Application(client_max_size=50 * 1024 ** 2)
+        app.router.add_post("/loadtest/updates", self.post_update)
+        app.router.add_get("/loadtest/events", self.get_events)
+        app.router.add_get("/file/bot{token}/{path:.*}", self.download_file)
+        app.router.add_route("*", "/bot{token}/{method}", self.call_method)
+        return app
+
+    async def read_params(self, request) -> dict:
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = {}
+            for key, value in (await request.post()).items():
+                params[key] = value if isinstance(value, str) else {"filename": value.filename}
+        if isinstance(params.get("reply_markup"), str):
+            params["reply_markup"] = json.loads(params["reply_markup"])
+        return params
+
+    def get_message(self, chat_id, **fields) -> dict:
+        return {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "from": self.bot_user,
+            **fields,
+        }
+
+    def add_event(self, method, params, message):
+        chat_id = int(params.get("chat_id", 0))
+        self.events[chat_id].append({"id": next(self.event_ids), "method": method, "params": params,
+                                     "message": message})
+        self.new_event[chat_id].set()
+
+    async def call_method(self, request):
+        method = request.match_info["method"]
+        params = await self.read_params(request)
+        if method == "getUpdates":
+            return self.ok(await self.get_updates(params))
+        if method == "getMe":
+            return self.ok(self.bot_user)
+        if method in ("deleteWebhook", "setWebhook", "answerCallbackQuery"):
+            return self.ok(True)
+        if method == "getFile":
+            return self.ok({"file_id": params["file_id"], "file_unique_id": params["file_id"], "file_size": 1024,
+                            "file_path": f"documents/{params['file_id']}.pdf"})
+        if method in BOT_METHODS_WITH_MESSAGE:
+            fields = {"text": params.get("text", "")}
+            if method == "sendDocument":
+                file_id = f"document-{next(self.file_ids)}"
+                fields = {"document": {"file_id": file_id, "file_unique_id": file_id}}
+            # like Telegram, only inline keyboards are echoed back on the message
+            if "inline_keyboard" in (params.get("reply_markup") or {}):
+                fields["reply_markup"] = params["reply_markup"]
+            message = self.get_message(params.get("chat_id", 0), **fields)
+            self.add_event(method, params, message)
+            return self.ok(message)
+        return web.json_response({"ok": False, "error_code": 400, "description": f"unsupported method {method}"})
+
+    async def get_updates(self, params) -> list:
+        offset = int(params.get("offset") or 0)
+        deadline = time.monotonic() + float(params.get("timeout") or 0)
+        self.updates = [update for update in self.updates if update["update_id"] >= offset]
+        while not self.updates and time.monotonic() < deadline:
+            self.new_update.clear()
+            try:
+                await asyncio.wait_for(self.new_update.wait(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                break
+        return self.updates[:int(params.get("limit") or 100)]
+
+    async def post_update(self, request):
+        update = await request.json()
+        update["update_id"] = next(self.update_ids)
+        self.updates.append(update)
+        self.new_update.set()
+        return self.ok(update["update_id"])
+
+    async def get_events(self, request):
+        chat_id = int(request.query["chat_id"])
+        after = int(request.query.get("after", 0))
+        deadline = time.monotonic() + float(request.query.get("timeout", 30))
+        while True:
+            events = [event for event in self.events[chat_id] if event["id"] > after]
+            if events or time.monotonic() >= deadline:
+                return self.ok(events)
+            self.new_event[chat_id].clear()
+            try:
+                await asyncio.wait_for(self.new_event[chat_id].wait(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                pass
+
+    async def download_file(self, request):
+        return web.Response(body=b"%PDF-1.4\n% load test CV\n", content_type="application/pdf")
+
+    @staticmethod
+    def ok(result):
+        return web.json_response({"ok": True, "result": result})
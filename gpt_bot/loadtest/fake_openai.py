@@ -0,0 +1,68 @@
+import asyncio
+import json
+import random
+import time
+
+from aiohttp import web
+
+
+def get_completion(prompt) -> str:
+    """Plausible canned answer for each kind of prompt the bot sends."""
+    if "JSON" in prompt:
+        return json.dumps({
+            "iq_test_score": 110,
+            "soft_skill_main_result": "Кандидат уверенно описывает рабочие ситуации.",
+            "soft_skill_recommendation": "Развивать навыки публичных выступлений.",
+            "professional_test_main_result": "Базовые технические знания подтверждены.",
+            "professional_test_recommendation": "Углубить знания архитектуры.",
+        }, ensure_ascii=False)
+    if "верни только цифру" in prompt:
+        return "110"
+    if prompt.startswith(("Give 10 questions", "Сформулируйте")):
+        return "\n".join(f"{i}. Вопрос номер {i}?" for i in range(1, 11))
+    return "Ответы кандидата в целом последовательны и аргументированы."
+
+
+class FakeOpenAI:
+    """
+    OpenAI compatible ``/v1/completions`` with configurable latency and
+    injected failures, streaming included.
+    """
+
+    def __init__(self, latency=1.0, jitter=0.5, error_rate=0.0, error_status=503, chunk_delay=0.05):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.chunk_delay = chunk_delay
+        self.counters = {"requests": 0, "errors": 0}
+
+    def get_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/completions", self.completions)
+        app.router.add_get("/stats", self.stats)
+        return app
+
+    async def completions(self, request):
+        payload = await request.json()
+        self.counters["requests"] += 1
+        await asyncio.sleep(max(0, random.gauss(self.latency, self.jitter)))
+        if random.random() < self.error_rate:
+            self.counters["errors"] += 1
+            return web.json_response({"error": {"message": "injected failure"}}, status=self.error_status)
+        text = get_completion(payload["prompt"])
+        if not payload.get("stream"):
+            return web.json_response({
+                "id": "cmpl-loadtest", "object": "text_completion", "created": int(time.time()),
+                "model": payload.get("model"), "choices": [{"text": text, "index": 0, "finish_reason": "stop"}],
+            })
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for line in text.splitlines(keepends=True):
+            await response.write(f"data: {json.dumps({'choices': [{'text': line, 'index': 0}]})}\n\n".encode())
+            await asyncio.sleep(self.chunk_delay)
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def stats(self, request):
+        return web.json_response(self.counters)
@@ -0,0 +1,218 @@
+import datetime
+import json
+import platform
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection
+from telegram import Bot, Update
+
+# name -> (factory, operations per repeat); a factory prepares data and returns the callable to time
+BENCHMARKS = {}
+
+
+def benchmark(name, number):
+    def decorator(factory):
+        BENCHMARKS[name] = (factory, number)
+        return factory
+
+    return decorator
+
+
+class BenchBot(Bot):
+    """Replies go nowhere, so handler timings are the bot's own work."""
+
+    def send_message(self, *args, **kwargs):
+        return None
+
+
+def get_update(bot, chat_id, text) -> Update:
+    return Update.de_json({
+        "update_id": 1,
+        "message": {
+            "message_id": 1,
+            "date": int(time.time()),
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+            "chat": {"id": chat_id, "type": "private", "first_name": "Bench"},
+            "text": text,
+        },
+    }, bot)
+
+
+def get_process():
+    from gpt_bot.models import FlowProcess, Region, Specialization, TelegramUser
+
+    user, _ = TelegramUser.objects.get_or_create(user_id=900000001, defaults={"username": "bench"})
+    process = FlowProcess.objects.create(
+        telegram_user=user,
+        full_name="Бенчмарк Кандидат",
+        phone_number="+998900000000",
+        birth_date=datetime.date(1995, 1, 1),
+        gender="male",
+        region=Region.objects.first(),
+        iq_test_score=118,
+        soft_skill_main_result="Кандидат уверенно описывает рабочие ситуации. " * 20,
+        soft_skill_recommendation="Развивать навыки публичных выступлений. " * 10,
+        professional_test_main_result="Базовые технические знания подтверждены. " * 20,
+        professional_test_recommendation="Углубить знания архитектуры. " * 10,
+    )
+    process.specialization.set(Specialization.objects.all()[:3])
+    return process
+
+
+@benchmark("generate_resume", number=3)
+def bench_generate_resume():
+    process = get_process()
+    return process.generate_resume
+
+
+@benchmark("regions_board", number=20000)
+def bench_regions_board():
+    from gpt_bot.bot.reference_data import reference_data
+
+    return reference_data.get_regions_board
+
+
+@benchmark("category_board", number=20000)
+def bench_category_board():
+    from gpt_bot.bot.reference_data import reference_data
+    from gpt_bot.models import Specialization
+
+    selected = [str(c_id) for c_id in Specialization.objects.values_list("id", flat=True)[:3]]
+    return lambda: reference_data.get_category_board(selected)
+
+
+@benchmark("question_answer", number=2000)
+def bench_question_answer():
+    from gpt_bot.bot import handlers
+
+    chat_id = 900000002
+    process = get_process()
+    handlers.set_user_conv_data(chat_id, {"process_id": process.id, "categories": []})
+    questions = [f"Вопрос {i}?" for i in range(10)]
+    update = get_update(BenchBot(settings.BOT_TOKEN), chat_id, "Ответ")
+    counter = iter(range(10 ** 9))
+
+    def run():
+        # any index but the last: one buffered answer and the next question, no database write
+        handlers.set_cur_question_state(
+            chat_id, {"questions": questions, "index": next(counter) % 9, "question_type": "iq_test"}
+        )
+        handlers.get_user_question_answer(update, None)
+
+    return run
+
+
+@benchmark("state_cycle", number=20000)
+def bench_state_cycle():
+    from gpt_bot.bot import handlers
+
+    chat_id = 900000003
+    handlers.set_user_conv_data(chat_id, {"phone_number": "+998900000000"})
+
+    def run():
+        handlers.get_user_conv_data(chat_id)
+        handlers.update_user_conv_data(chat_id, full_name="Бенчмарк Кандидат")
+        handlers.get_user_conv_data(chat_id)
+
+    return run
+
+
+@benchmark("init_user", number=20000)
+def bench_init_user():
+    from gpt_bot.bot import handlers
+
+    update = get_update(BenchBot(settings.BOT_TOKEN), 900000004, "/start")
+    wrapped = handlers.init_user(lambda update, context: None)
+    return lambda: wrapped(update, None)
+
+
+def measure(run, number, repeat) -> dict:
+    run()  # warm up caches and lazy imports
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            run()
+        timings.append((time.perf_counter() - started) / number * 10 ** 6)
+    return {"us_per_op": round(min(timings), 3), "median_us": round(statistics.median(timings), 3), "number": number}
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the hot paths on the SQLite profile and compare with a JSON baseline; exits non-zero when one "
+        "regresses by more than --threshold percent, cannot run or has no baseline; "
+        "leave benchmarks out with --only. "
+        "Run with DJANGO_SETTINGS_MODULE=hr_pgt_bot.settings_bench"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--baseline", default=str(settings.BASE_DIR / "bench_baseline.json"))
+        parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline")
+        parser.add_argument("--threshold", type=float, default=20, help="Allowed slowdown in percent")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS), default=None)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError(
+                "benchmarks write test rows; run them with DJANGO_SETTINGS_MODULE=hr_pgt_bot.settings_bench"
+            )
+        call_command("migrate", verbosity=0)
+        self.seed()
+        results = {}
+        skipped = []
+        for name in options["only"] or BENCHMARKS:
+            factory, number = BENCHMARKS[name]
+            try:
+                results[name] = measure(factory(), number, options["repeat"])
+            except (ImportError, OSError) as e:
+                # e.g. weasyprint without its system libraries
+                self.stderr.write(f"{name}: skipped, {e!r}")
+                skipped.append(name)
+        if options["save_baseline"]:
+            with open(options["baseline"], "w") as f:
+                json.dump({"python": platform.python_version(), "machine": platform.machine(), "results": results},
+                          f, indent=2)
+            self.stdout.write(f"baseline written to {options['baseline']}")
+        self.report(results, skipped, self.load_baseline(options["baseline"]), options["threshold"])
+
+    @staticmethod
+    def seed():
+        from gpt_bot.models import Region, Specialization
+
+        if not Region.objects.exists():
+            Region.objects.bulk_create([Region(name=f"Регион {i}") for i in range(14)])
+        if not Specialization.objects.exists():
+            Specialization.objects.bulk_create([Specialization(name=f"Технология {i}") for i in range(30)])
+
+    @staticmethod
+    def load_baseline(path) -> dict:
+        # without a baseline nothing is compared and every run would pass
+        try:
+            with open(path) as f:
+                return json.load(f)["results"]
+        except FileNotFoundError:
+            raise CommandError(f"no baseline at {path}; record one with --save-baseline --repeat 10")
+
+    def report(self, results, skipped, baseline, threshold):
+        # a benchmark that did not run or has nothing to compare with fails the check unless left out with --only
+        failures = [f"{name} skipped" for name in skipped]
+        self.stdout.write(f"{'benchmark':<18}{'us/op':>12}{'median':>12}{'baseline':>12}{'change':>9}")
+        for name, result in results.items():
+            base = baseline.get(name, {}).get("us_per_op")
+            change = ""
+            if base:
+                percent = (result["us_per_op"] - base) / base * 100
+                change = f"{percent:+.1f}%"
+                if percent > threshold:
+                    failures.append(f"{name} regressed by {change}")
+            else:
+                failures.append(f"{name} not in the baseline")
+            self.stdout.write(
+                f"{name:<18}{result['us_per_op']:>12}{result['median_us']:>12}{base or '-':>12}{change:>9}"
+            )
+        if failures:
+            raise CommandError(f"benchmark check failed (threshold {threshold}%): " + ", ".join(failures))
@@ -0,0 +1,81 @@
+import json
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+from django.core.management import BaseCommand
+
+ENGINES = ("uncached", "cached")
+
+
+def synthetic_context(i) -> dict:
+    rnd = random.Random(i)
+    iq_score = rnd.randint(60, 160)
+    paragraph = " ".join(rnd.choice(["коммуникация", "лидерство", "Python", "Django", "SQL", "адаптивность"])
+                         for _ in range(rnd.randint(40, 120)))
+    return {
+        "full_name": f"Кандидат {i}",
+        "age": rnd.randint(18, 60),
+        "specialty": ", ".join(rnd.sample(["Python", "Django", "Frontend", "DevOps", "QA"], rnd.randint(1, 3))),
+        "soft_skill_result": paragraph,
+        "soft_skill_recommendation": paragraph[::-1],
+        "professional_test_main_result": paragraph,
+        "professional_test_recommendation": paragraph[::-1],
+        "iq_score": iq_score,
+        "iq_score_range": str(rnd.randint(1, 9)),
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class Command(BaseCommand):
+    help = "Measure per-PDF render time and peak RSS of the resume renderer over synthetic FlowProcess contexts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=1000)
+        parser.add_argument("--engine", choices=ENGINES + ("both",), default="both")
+
+    def handle(self, *args, **options):
+        if options["engine"] != "both":
+            self.stdout.write(json.dumps(self.run_engine(options["engine"], options["count"])))
+            return
+        # every engine runs in its own process so peak RSS is not shared between them
+        results = []
+        for engine in ENGINES:
+            output = subprocess.run(
+                [sys.executable, sys.argv[0], "bench_resume_render", "--engine", engine, "--count", str(options["count"])],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+        self.stdout.write(f"{'engine':<10} {'renders':>8} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'peak RSS MB':>12}")
+        for r in results:
+            self.stdout.write(
+                f"{r['engine']:<10} {r['count']:>8} {r['mean_ms']:>9} {r['p50_ms']:>9} {r['p95_ms']:>9} "
+                f"{r['peak_rss_mb']:>12}"
+            )
+
+    def run_engine(self, engine, count) -> dict:
+        from gpt_bot import resume
+
+        render = resume.renderer.render if engine == "cached" else resume.render_resume_uncached
+        timings = []
+        for i in range(count):
+            context = synthetic_context(i)
+            started = time.perf_counter()
+            render(context)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return {
+            "engine": engine,
+            "count": count,
+            "mean_ms": round(statistics.mean(timings), 2),
+            "p50_ms": round(timings[len(timings) // 2], 2),
+            "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 2),
+            "peak_rss_mb": peak_rss_mb(),
+        }
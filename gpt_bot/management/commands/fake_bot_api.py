@@ -0,0 +1,15 @@
+from aiohttp import web
+from django.core.management import BaseCommand
+
+from gpt_bot.loadtest.fake_bot_api import FakeBotAPI
+
+
+class Command(BaseCommand):
+    help = "Serve an in-memory Telegram Bot API for load tests; point TELEGRAM_API_URL of the bot at it"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8081)
+
+    def handle(self, *args, **options):
+        web.run_app(FakeBotAPI().get_app(), host=options["host"], port=options["port"], print=self.stdout.write)
@@ -0,0 +1,27 @@
+from aiohttp import web
+from django.core.management import BaseCommand
+
+from gpt_bot.loadtest.fake_openai import FakeOpenAI
+
+
+class Command(BaseCommand):
+    help = "Serve an OpenAI compatible completions API with injected latency and errors; set OPENAI_API_BASE to it"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8082)
+        parser.add_argument("--latency", type=float, default=1.0, help="Mean seconds before the response starts")
+        parser.add_argument("--jitter", type=float, default=0.5, help="Standard deviation of the latency")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests that fail")
+        parser.add_argument("--error-status", type=int, default=503)
+        parser.add_argument("--chunk-delay", type=float, default=0.05, help="Seconds between streamed lines")
+
+    def handle(self, *args, **options):
+        server = FakeOpenAI(
+            latency=options["latency"],
+            jitter=options["jitter"],
+            error_rate=options["error_rate"],
+            error_status=options["error_status"],
+            chunk_delay=options["chunk_delay"],
+        )
+        web.run_app(server.get_app(), host=options["host"], port=options["port"], print=self.stdout.write)
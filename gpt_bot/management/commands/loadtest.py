@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+from django.core.management import BaseCommand
+
+from gpt_bot.loadtest.driver import run_load
+from gpt_bot.models import Region, Specialization, UserLimit
+
+
+class Command(BaseCommand):
+    help = (
+        "Walk N virtual candidates through the whole conversation and report throughput, per-state latency "
+        "percentiles and error rates. Start `fake_bot_api`, `fake_openai` and `run_bot` with "
+        "TELEGRAM_API_URL=http://127.0.0.1:8081 OPENAI_API_BASE=http://127.0.0.1:8082/v1 first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bot-api", default="http://127.0.0.1:8081")
+        parser.add_argument("--candidates", type=int, default=10)
+        parser.add_argument("--ramp", type=float, default=0, help="Seconds over which candidates are started")
+        parser.add_argument("--step-timeout", type=float, default=60)
+        parser.add_argument("--resume-timeout", type=float, default=300)
+        parser.add_argument("--chat-id-base", type=int, default=7000000)
+        parser.add_argument("--seed", action="store_true",
+                            help="Create the phone quotas, a region and a specialization the candidates need")
+        parser.add_argument("--output", default=None, help="Also write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        if options["seed"]:
+            self.seed(options["chat_id_base"], options["candidates"])
+        report = asyncio.run(run_load(
+            options["bot_api"],
+            options["candidates"],
+            ramp=options["ramp"],
+            chat_id_base=options["chat_id_base"],
+            step_timeout=options["step_timeout"],
+            resume_timeout=options["resume_timeout"],
+        ))
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+        self.stdout.write(
+            f"{report['completed']}/{report['candidates']} candidates in {report['seconds']}s, "
+            f"{report['candidates_per_minute']} candidates/min, {report['updates_per_second']} updates/s"
+        )
+        self.stdout.write(f"{'state':<12}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'errors':>8}")
+        for step, row in report["steps"].items():
+            self.stdout.write(
+                f"{step:<12}{row['count']:>7}{row['p50']:>9}{row['p95']:>9}{row['p99']:>9}{row['max']:>9}"
+                f"{row['errors']:>8}"
+            )
+
+    @staticmethod
+    def seed(chat_id_base, candidates):
+        # must match VirtualCandidate.phone_number
+        phones = [f"+99890{(chat_id_base + i) % 10 ** 7:07d}" for i in range(candidates)]
+        existing = set(UserLimit.objects.filter(phone_number__in=phones).values_list("phone_number", flat=True))
+        UserLimit.objects.bulk_create([UserLimit(phone_number=phone, limit=10 ** 6) for phone in phones
+                                       if phone not in existing])
+        UserLimit.objects.filter(phone_number__in=phones).update(used=0)
+        if not Region.objects.exists():
+            Region.objects.create(name="Load test")
+        if not Specialization.objects.exists():
+            Specialization.objects.create(name="Python")
@@ -0,0 +1,8 @@
+from django.core.management import BaseCommand
+
+
+class Command(BaseCommand):
+    def handle(self, *args, **options):
+        from gpt_bot.bot import question_bank
+        created = question_bank.refill()
+        self.stdout.write(f"Created {created} question sets")
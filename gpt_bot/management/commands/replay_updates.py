@@ -0,0 +1,60 @@
+import json
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "POST recorded Telegram updates (JSON array or one update per line) to the webhook endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--url", default="http://localhost:8045/telegram/webhook/")
+        parser.add_argument("--secret", default=None, help="Defaults to TELEGRAM_WEBHOOK_SECRET")
+        parser.add_argument("--chat-id", type=int, default=None, help="Rewrite every chat/user id to this value")
+        parser.add_argument("--delay", type=float, default=0, help="Seconds to wait between updates")
+
+    def handle(self, *args, **options):
+        secret = options["secret"] if options["secret"] is not None else settings.TELEGRAM_WEBHOOK_SECRET
+        for update in self.read_updates(options["path"]):
+            if options["chat_id"] is not None:
+                update = self.rewrite_chat_id(update, options["chat_id"])
+            request = urllib.request.Request(
+                options["url"],
+                data=json.dumps(update).encode(),
+                headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret},
+                method="POST",
+            )
+            try:
+                with urllib.request.urlopen(request) as response:
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            self.stdout.write(f"update {update.get('update_id')}: {status}")
+            time.sleep(options["delay"])
+
+    @staticmethod
+    def read_updates(path) -> list:
+        with open(path) as f:
+            content = f.read().strip()
+        if content.startswith("["):
+            return json.loads(content)
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    @staticmethod
+    def rewrite_chat_id(update, chat_id) -> dict:
+        update = json.loads(json.dumps(update))
+        for key in ("message", "edited_message", "callback_query"):
+            if key not in update:
+                continue
+            event = update[key]
+            message = event.get("message", event)
+            for user in (event.get("from"), message.get("from"), message.get("chat")):
+                if user:
+                    user["id"] = chat_id
+            if "contact" in message:
+                message["contact"]["user_id"] = chat_id
+        return update
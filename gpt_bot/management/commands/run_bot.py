@@ -1,6 +1,50 @@
-from django.core.management import BaseCommand
+from django.conf import settings
+from django.core.management import BaseCommand, call_command
+from prometheus_client import start_http_server
 
 
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--webhook", action="store_true",
+            help="Register TELEGRAM_WEBHOOK_URL and receive updates through the Django app instead of polling",
+        )
+        parser.add_argument("--addrport", default="0.0.0.0:8045", help="Address the webhook server listens on")
+        parser.add_argument(
+            "--ingest", action="store_true",
+            help="Only fetch updates and route them by chat id to the shard queues (SHARD_QUEUE_URL)",
+        )
+        parser.add_argument("--shard", type=int, default=None, help="Run as the worker for this shard")
+        parser.add_argument("--shards", type=int, default=settings.BOT_SHARDS, help="Total number of shards")
+        parser.add_argument(
+            "--metrics-port", type=int, default=settings.BOT_METRICS_PORT,
+            help="Port of the bot process metrics exporter, 0 disables it; shard workers add their shard number",
+        )
+
     def handle(self, *args, **options):
+        # in webhook mode the Django /metrics route serves the same registry
+        if options["metrics_port"] and not options["webhook"]:
+            port = options["metrics_port"] + (options["shard"] + 1 if options["shard"] is not None else 0)
+            start_http_server(port)
+        if options["ingest"]:
+            from gpt_bot.bot import sharding
+            from gpt_bot.bot.loader import updater
+
+            sharding.run_ingest(updater.bot, sharding.get_update_queue(), options["shards"])
+            return
+
         from gpt_bot.bot import main
+
+        if options["shard"] is not None:
+            main.run_shard_worker(options["shard"])
+            return
+
+        if not options["webhook"]:
+            main.start_polling()
+            return
+        from gpt_bot.bot import webhook
+
+        main.set_webhook()
+        main.start_dispatcher()
+        webhook.enable()
+        call_command("runserver", options["addrport"], use_reloader=False)
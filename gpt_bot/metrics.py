@@ -0,0 +1,72 @@
+import functools
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+
+LLM_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+handler_seconds = Histogram("bot_handler_seconds", "Handler run time", ["handler", "state"])
+handler_errors = Counter("bot_handler_errors_total", "Handlers that raised", ["handler", "state"])
+handlers_in_progress = Gauge("bot_handlers_in_progress", "Handlers running right now", ["handler"])
+
+llm_seconds = Histogram("llm_request_seconds", "LLM completion time", ["profile", "model", "outcome"],
+                        buckets=LLM_BUCKETS)
+llm_in_progress = Gauge("llm_requests_in_progress", "LLM completions running right now", ["profile"])
+llm_queue_depth = Gauge("llm_queue_depth", "LLM calls waiting for a rate limit or concurrency slot")
+llm_cache_requests = Counter("llm_cache_requests_total", "LLM response cache lookups", ["result"])
+first_question_seconds = Histogram("bot_first_question_seconds", "Time from starting a question stream "
+                                   "to its first question", ["question_type"], buckets=LLM_BUCKETS)
+
+dispatch_queued = Gauge("bot_dispatch_queued_updates", "Updates waiting in the per-chat queues")
+dispatch_chats_in_flight = Gauge("bot_dispatch_chats_in_flight", "Chats with queued or running updates")
+dispatch_dropped = Counter("bot_dispatch_dropped_total", "Updates dropped because their chat queue was full")
+idempotency_hits = Counter("bot_idempotency_hits_total", "Redelivered updates and coalesced operations",
+                           ["kind"])
+quota_checks = Counter("bot_quota_checks_total", "Test attempt checks by phone number", ["result"])
+
+db_seconds = Histogram("db_query_seconds", "Database statement time", ["operation", "many"], buckets=DB_BUCKETS)
+
+resume_job_seconds = Histogram("resume_job_seconds", "Resume render pool time from submit to result", ["outcome"],
+                               buckets=LLM_BUCKETS)
+resume_render_seconds = Histogram("resume_render_seconds", "PDF render time in the render worker",
+                                  buckets=LLM_BUCKETS)
+resume_renders_in_progress = Gauge("resume_renders_in_progress", "Resume jobs in the render pool")
+
+
+def instrument_handler(callback, state):
+    name = getattr(callback, "__name__", repr(callback))
+
+    @functools.wraps(callback)
+    def wrapper(update, context):
+        started = time.perf_counter()
+        with handlers_in_progress.labels(name).track_inprogress():
+            try:
+                return callback(update, context)
+            except Exception:
+                handler_errors.labels(name, state).inc()
+                raise
+            finally:
+                handler_seconds.labels(name, state).observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+def instrument_conversation(conversation_handler, states):
+    """Wrap the callback of every handler of a ConversationHandler, labeled by the state it serves."""
+    names = {value: name for name, value in vars(states).items() if name.isupper()}
+    groups = [("entry", conversation_handler.entry_points), ("fallback", conversation_handler.fallbacks)]
+    groups += [(names.get(state, str(state)), handlers) for state, handlers in conversation_handler.states.items()]
+    for state, handlers in groups:
+        for handler in handlers:
+            handler.callback = instrument_handler(handler.callback, state)
+
+
+def time_query(execute, sql, params, many, context):
+    """Execute wrapper installed on every database connection; ``many`` marks executemany batches."""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        operation = sql.lstrip().split(" ", 1)[0].upper() if sql else ""
+        db_seconds.labels(operation, str(many).lower()).observe(time.perf_counter() - started)
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.1 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gpt_bot", "0008_flowprocess_generated_resume"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="flowprocess",
+            name="analysis_timings",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.1.1 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gpt_bot", "0009_flowprocess_analysis_timings"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QuestionBankEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("last_used_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "question_type",
+                    models.CharField(
+                        choices=[
+                            ("iq_test", "IQ Test"),
+                            ("soft_skill", "Soft Skill"),
+                            ("professional_test", "Professional Test"),
+                        ],
+                        max_length=32,
+                    ),
+                ),
+                (
+                    "specialization_key",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                ("questions", models.JSONField()),
+                ("used", models.IntegerField(default=0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["question_type", "specialization_key", "used"],
+                        name="question_bank_lookup_idx",
+                    )
+                ],
+            },
+        ),
+    ]
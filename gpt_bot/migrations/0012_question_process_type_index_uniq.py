@@ -0,0 +1,38 @@
+# Generated by Django 4.1.1 on 2026-10-18 14:41
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def remove_duplicate_questions(apps, schema_editor):
+    Question = apps.get_model("gpt_bot", "Question")
+    duplicates = (
+        Question.objects.filter(process__isnull=False)
+        .values("process", "question_type", "index")
+        .annotate(keep_id=Max("id"), total=models.Count("id"))
+        .filter(total__gt=1)
+    )
+    for duplicate in duplicates:
+        Question.objects.filter(
+            process=duplicate["process"],
+            question_type=duplicate["question_type"],
+            index=duplicate["index"],
+        ).exclude(id=duplicate["keep_id"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gpt_bot", "0011_resumejob"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_questions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="question",
+            constraint=models.UniqueConstraint(
+                fields=("process", "question_type", "index"),
+                name="question_process_type_index_uniq",
+            ),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.1.1 on 2026-10-18 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gpt_bot', '0012_question_process_type_index_uniq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flowprocess',
+            name='cv_error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='flowprocess',
+            name='cv_file',
+            field=models.FileField(blank=True, null=True, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='flowprocess',
+            name='cv_file_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='flowprocess',
+            name='cv_sha256',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
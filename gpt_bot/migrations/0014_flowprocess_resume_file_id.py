@@ -0,0 +1,18 @@
+# Generated by Django 4.1.1 on 2026-10-18 13:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gpt_bot', '0013_flowprocess_cv_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flowprocess',
+            name='resume_file_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.1.1 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+def merge_phone_numbers(apps, schema_editor):
+    """Normalize phone numbers like UserLimit.save does; rows of the same number are merged into the oldest."""
+    UserLimit = apps.get_model("gpt_bot", "UserLimit")
+    kept = {}
+    for user_limit in UserLimit.objects.order_by("id"):
+        phone_number = "+" + "".join(char for char in user_limit.phone_number if char.isdigit())
+        first = kept.get(phone_number)
+        if first is None:
+            user_limit.phone_number = phone_number
+            user_limit.save(update_fields=["phone_number"])
+            kept[phone_number] = user_limit
+            continue
+        first.limit += user_limit.limit
+        first.used += user_limit.used
+        first.save(update_fields=["limit", "used"])
+        user_limit.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gpt_bot", "0014_flowprocess_resume_file_id"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_phone_numbers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="userlimit",
+            constraint=models.UniqueConstraint(fields=("phone_number",), name="user_limit_phone_number_uniq"),
+        ),
+    ]
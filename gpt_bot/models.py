@@ -1,10 +1,12 @@
 import datetime
+import time
 
 from django.conf import settings
 from django.core.files.base import ContentFile
 from django.db import models
-from django.template.loader import render_to_string
-from weasyprint import HTML
+from django.utils import timezone
+
+from gpt_bot import resume
 
 
 class TelegramUser(models.Model):
@@ -49,7 +51,12 @@ class FlowProcess(models.Model):
     gender = models.CharField(max_length=8, choices=Gender.choices)
     region = models.ForeignKey(Region, on_delete=models.CASCADE, null=True)
     specialization = models.ManyToManyField(Specialization)
+    # legacy Telegram download urls, they expire; new CVs are copied to cv_file by the bot in the background
     cv = models.URLField(null=True, blank=True)
+    cv_file_id = models.CharField(max_length=255, null=True, blank=True)
+    cv_file = models.FileField(null=True, blank=True)
+    cv_sha256 = models.CharField(max_length=64, null=True, blank=True)
+    cv_error = models.TextField(null=True, blank=True)
 
     iq_test_score = models.IntegerField(null=True, blank=True)
 
@@ -58,8 +65,11 @@ class FlowProcess(models.Model):
 
     professional_test_main_result = models.TextField(null=True, blank=True)
     professional_test_recommendation = models.TextField(null=True, blank=True)
+    analysis_timings = models.JSONField(null=True, blank=True)
 
     generated_resume = models.FileField(null=True, blank=True)
+    # Telegram file id of the uploaded generated_resume, sends after the first one reuse it
+    resume_file_id = models.CharField(max_length=255, null=True, blank=True)
 
     def __str__(self) -> str:
         return f"{self.full_name} - {self.id}"
@@ -67,7 +77,7 @@ class FlowProcess(models.Model):
     def get_age(self):
         return (datetime.date.today() - self.birth_date).days // 365
 
-    def generate_resume(self):
+    def get_resume_context(self) -> dict:
         self.iq_test_score = self.iq_test_score or 0
         if self.iq_test_score > 150:
             iq_score_range = "1"
@@ -99,10 +109,18 @@ class FlowProcess(models.Model):
             "iq_score": self.iq_test_score,
             "iq_score_range": iq_score_range
         }
-        html_string = render_to_string("resume.html", context)
-        html_file = HTML(string=html_string).write_pdf()
-        self.generated_resume.save(f"media/generated_resume/{self.pk}.pdf", ContentFile(html_file))
-        self.save()
+        return context
+
+    def generate_resume(self) -> float:
+        """Render and store the resume PDF; returns the seconds spent in the renderer."""
+        started = time.monotonic()
+        html_file = resume.renderer.render(self.get_resume_context())
+        render_seconds = time.monotonic() - started
+        self.resume_file_id = None
+        self.generated_resume.save(f"media/generated_resume/{self.pk}.pdf", ContentFile(html_file), save=False)
+        # a full save would write back the CV fields the ingest job may have set in the meantime
+        self.save(update_fields=["generated_resume", "resume_file_id", "iq_test_score"])
+        return render_seconds
 
 
 class QuestionType(models.TextChoices):
@@ -122,6 +140,62 @@ class Question(models.Model):
     def __str__(self) -> str:
         return f"{self.question_type} - {self.index}"
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["process", "question_type", "index"], name="question_process_type_index_uniq"
+            ),
+        ]
+
+
+class QuestionBankEntry(models.Model):
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(null=True, blank=True)
+    question_type = models.CharField(max_length=32, choices=QuestionType.choices)
+    # normalized Specialization ids ("1,4,7"), empty for iq_test and soft_skill sets
+    specialization_key = models.CharField(max_length=255, blank=True, default="")
+    questions = models.JSONField()
+    used = models.IntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.question_type} [{self.specialization_key}] - {self.used}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["question_type", "specialization_key", "used"], name="question_bank_lookup_idx"),
+        ]
+
+
+class ResumeJobStatus(models.TextChoices):
+    pending = "pending", "Pending"
+    running = "running", "Running"
+    done = "done", "Done"
+    failed = "failed", "Failed"
+
+
+class ResumeJob(models.Model):
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    process = models.OneToOneField(FlowProcess, on_delete=models.CASCADE, related_name="resume_job")
+    chat_id = models.BigIntegerField()
+    status = models.CharField(max_length=16, choices=ResumeJobStatus.choices, default=ResumeJobStatus.pending)
+    attempts = models.IntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    error = models.TextField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.process_id} - {self.status}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="resume_job_queue_idx"),
+        ]
+
+
+def normalize_phone_number(phone_number) -> str:
+    """``+`` and the digits, the form both Telegram contacts and admin entries are stored and looked up in."""
+    return "+" + "".join(char for char in phone_number if char.isdigit())
+
 
 class UserLimit(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
@@ -131,3 +205,12 @@ class UserLimit(models.Model):
 
     def __str__(self) -> str:
         return self.phone_number
+
+    def save(self, *args, **kwargs):
+        self.phone_number = normalize_phone_number(self.phone_number)
+        super().save(*args, **kwargs)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["phone_number"], name="user_limit_phone_number_uniq"),
+        ]
@@ -0,0 +1,71 @@
+import threading
+
+from django.conf import settings
+from django.template.loader import get_template
+
+
+class ResumeRenderer:
+    """
+    Resume PDF renderer that loads the compiled template, the parsed stylesheet
+    and the font configuration once and reuses them for every render.
+    Remote assets (web fonts) are fetched once per process as well.
+    """
+
+    def __init__(self, template_name="resume.html", stylesheet_name="resume.css"):
+        self.template_name = template_name
+        self.stylesheet_name = stylesheet_name
+        self.template = None
+        self.stylesheets = None
+        self.font_config = None
+        self.image_cache = {}
+        self._fetched = {}
+        self._lock = threading.Lock()
+
+    def fetch_url(self, url):
+        from weasyprint import default_url_fetcher
+
+        if url not in self._fetched:
+            result = default_url_fetcher(url)
+            if "file_obj" in result:
+                result["string"] = result.pop("file_obj").read()
+            self._fetched[url] = result
+        return dict(self._fetched[url])
+
+    def load(self):
+        from weasyprint import CSS
+        from weasyprint.text.fonts import FontConfiguration
+
+        with self._lock:
+            if self.template is not None:
+                return
+            self.font_config = FontConfiguration()
+            self.stylesheets = [
+                CSS(
+                    filename=str(settings.BASE_DIR / "templates" / self.stylesheet_name),
+                    font_config=self.font_config,
+                    url_fetcher=self.fetch_url,
+                )
+            ]
+            self.template = get_template(self.template_name)
+
+    def render(self, context) -> bytes:
+        from weasyprint import HTML
+
+        self.load()
+        html = HTML(string=self.template.render(context), url_fetcher=self.fetch_url)
+        return html.write_pdf(stylesheets=self.stylesheets, font_config=self.font_config, cache=self.image_cache)
+
+
+def render_resume_uncached(context, template_name="resume.html", stylesheet_name="resume.css") -> bytes:
+    """Previous render path: template, CSS and fonts rebuilt on every call. Kept for benchmarking."""
+    from django.template.loader import render_to_string
+    from weasyprint import CSS, HTML
+    from weasyprint.text.fonts import FontConfiguration
+
+    font_config = FontConfiguration()
+    stylesheet = CSS(filename=str(settings.BASE_DIR / "templates" / stylesheet_name), font_config=font_config)
+    html = HTML(string=render_to_string(template_name, context))
+    return html.write_pdf(stylesheets=[stylesheet], font_config=font_config)
+
+
+renderer = ResumeRenderer()
@@ -0,0 +1,28 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from gpt_bot.models import Region, Specialization, UserLimit
+
+
+@receiver([post_save, post_delete], sender=Region)
+@receiver([post_save, post_delete], sender=Specialization)
+def invalidate_reference_data(sender, **kwargs):
+    from gpt_bot.bot.reference_data import invalidate
+
+    invalidate()
+
+
+@receiver(post_save, sender=UserLimit)
+def invalidate_user_limit(sender, instance, **kwargs):
+    from gpt_bot.bot import quota
+
+    quota.invalidate(instance.phone_number)
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    from gpt_bot.metrics import time_query
+
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
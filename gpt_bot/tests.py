@@ -1,3 +1,484 @@
-from django.test import TestCase
+import asyncio
+import concurrent.futures
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib import admin as django_admin
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase, TestCase, override_settings
+from telegram.error import Unauthorized
+
+from gpt_bot import admin, metrics, resume
+from gpt_bot.bot import question_bank, question_stream, quota, resume_jobs, webhook
+from gpt_bot.bot.cv_ingest import CVIngestor, LocalFileSource
+from gpt_bot.bot.dispatch import ChatScheduler
+from gpt_bot.bot.idempotency import SingleFlight, UpdateDeduplicator
+from gpt_bot.bot.llm_control import CircuitBreaker, LLMControl, LLMUnavailable
+from gpt_bot.bot.sharding import HashRing, RedisUpdateQueue, SQLiteUpdateQueue
+from gpt_bot.bot.state_store import MemoryStateStore
+from gpt_bot.models import FlowProcess, QuestionBankEntry, Specialization, TelegramUser, UserLimit
+
+
+class HashRingTests(SimpleTestCase):
+    def test_placement_is_stable_and_in_range(self):
+        ring = HashRing(4)
+        shards = [ring.get_shard(chat_id) for chat_id in range(1000)]
+        self.assertEqual(shards, [HashRing(4).get_shard(chat_id) for chat_id in range(1000)])
+        self.assertEqual(set(shards), {0, 1, 2, 3})
+        self.assertGreater(min(Counter(shards).values()), 150)
+
+    def test_adding_a_shard_only_moves_chats_to_it(self):
+        before, after = HashRing(4), HashRing(5)
+        moved = [chat_id for chat_id in range(1000) if before.get_shard(chat_id) != after.get_shard(chat_id)]
+        self.assertTrue(all(after.get_shard(chat_id) == 4 for chat_id in moved))
+        self.assertLess(len(moved), 350)
+
+
+class SQLiteUpdateQueueTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.queue = SQLiteUpdateQueue(os.path.join(directory.name, "updates.sqlite3"), poll_interval=0.01)
+
+    def test_unacknowledged_update_is_replayed_after_recover(self):
+        self.queue.put(0, {"update_id": 1})
+        self.queue.put(0, {"update_id": 2})
+        token, payload = self.queue.get(0, timeout=0)
+        self.assertEqual(payload, {"update_id": 1})
+        self.assertEqual(self.queue.get(0, timeout=0)[1], {"update_id": 2})
+
+        self.queue.recover(0)
+        self.assertEqual(self.queue.get(0, timeout=0), (token, {"update_id": 1}))
+
+    def test_acknowledged_update_is_not_replayed(self):
+        self.queue.put(0, {"update_id": 1})
+        self.queue.put(0, {"update_id": 2})
+        token, _ = self.queue.get(0, timeout=0)
+        self.queue.ack(0, token)
+
+        self.queue.recover(0)
+        self.assertEqual(self.queue.get(0, timeout=0)[1], {"update_id": 2})
+
+    def test_shards_are_separate(self):
+        self.queue.put(1, {"update_id": 1})
+        self.assertIsNone(self.queue.get(0, timeout=0))
+        self.assertEqual(self.queue.get(1, timeout=0)[1], {"update_id": 1})
+
+
+
+@skipUnless(os.environ.get("TEST_REDIS_URL"), "set TEST_REDIS_URL to a scratch Redis database")
+class RedisUpdateQueueTests(SimpleTestCase):
+    def setUp(self):
+        self.queue = RedisUpdateQueue(os.environ["TEST_REDIS_URL"], prefix=f"test_updates_{os.getpid()}")
+        self.addCleanup(lambda: self.queue.client.delete(*self.queue.get_keys(0)))
+
+    def test_unacknowledged_updates_are_replayed_first_in_order(self):
+        for update_id in (1, 2, 3):
+            self.queue.put(0, {"update_id": update_id})
+        self.queue.get(0)
+        self.queue.get(0)
+        self.queue.put(0, {"update_id": 4})
+
+        self.queue.recover(0)
+        self.assertEqual([self.queue.get(0)[1]["update_id"] for _ in range(4)], [1, 2, 3, 4])
+
+    def test_acknowledged_update_is_not_replayed(self):
+        self.queue.put(0, {"update_id": 1})
+        self.queue.put(0, {"update_id": 2})
+        token, _ = self.queue.get(0)
+        self.queue.ack(0, token)
+
+        self.queue.recover(0)
+        self.assertEqual(self.queue.get(0)[1], {"update_id": 2})
+        self.assertIsNone(self.queue.get(0, timeout=1))
+
+class MemoryStateStoreTests(SimpleTestCase):
+    def test_version_zero_claims_a_missing_key_once(self):
+        store = MemoryStateStore()
+        self.assertTrue(store.compare_and_set("claim", 0, {"owner": 1}))
+        self.assertFalse(store.compare_and_set("claim", 0, {"owner": 2}))
+        self.assertEqual(store.get("claim"), {"owner": 1})
+
+        store.delete("claim")
+        self.assertTrue(store.compare_and_set("claim", 0, {"owner": 2}))
+
+    def test_expired_key_can_be_claimed_again(self):
+        store = MemoryStateStore()
+        self.assertTrue(store.compare_and_set("claim", 0, {"owner": 1}, ttl=0.01))
+        time.sleep(0.02)
+        self.assertTrue(store.compare_and_set("claim", 0, {"owner": 2}))
+
+
+class QuestionStreamTests(SimpleTestCase):
+    def stream(self, store, questions):
+        async def run():
+            first_question = asyncio.get_running_loop().create_future()
+            await question_stream.stream_into_state("state", "iq_test", "prompt", first_question)
+            return first_question.result()
+
+        with mock.patch.object(question_stream, "state_store", store), \
+                mock.patch.object(question_stream, "astream_questions", questions):
+            return asyncio.run(run())
+
+    def test_questions_are_appended_and_completed(self):
+        async def questions(*args):
+            for question in ("q1", "q2", "q3"):
+                yield question
+
+        store = MemoryStateStore()
+        self.assertEqual(self.stream(store, questions), "q1")
+        data = store.get("state")
+        self.assertEqual(data["questions"], ["q1", "q2", "q3"])
+        self.assertTrue(data["complete"])
+
+    def test_replaced_state_is_left_alone(self):
+        store = MemoryStateStore()
+
+        async def questions(*args):
+            yield "q1"
+            # the user restarted the stage while the stream was running
+            store.replace("state", {"questions": ["other"], "index": 0, "question_type": "iq_test"})
+            yield "q2"
+
+        self.stream(store, questions)
+        self.assertEqual(store.get("state"), {"questions": ["other"], "index": 0, "question_type": "iq_test"})
+
+    def test_cancel_stops_the_stream(self):
+        async def questions(*args):
+            yield "q1"
+            await asyncio.sleep(60)
+            yield "q2"
+
+        with mock.patch.object(question_stream, "state_store", MemoryStateStore()), \
+                mock.patch.object(question_stream, "astream_questions", questions), \
+                mock.patch.object(question_stream, "get_question_prompt", return_value="prompt"):
+            self.assertEqual(question_stream.start("state", "iq_test"), "q1")
+            self.assertIn("state", question_stream._streams)
+            question_stream.cancel("state")
+            deadline = time.monotonic() + 5
+            while "state" in question_stream._streams and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertNotIn("state", question_stream._streams)
+
+
+class ChatSchedulerTests(SimpleTestCase):
+    def test_tasks_of_a_chat_run_in_submit_order(self):
+        scheduler = ChatScheduler(workers=4, max_chats=8, max_pending=100)
+        runs = defaultdict(list)
+        scheduler.start()
+        for i in range(50):
+            for chat_id in range(5):
+                scheduler.submit(chat_id, lambda chat_id=chat_id, i=i: runs[chat_id].append(i))
+        scheduler.stop(timeout=5)
+        self.assertEqual(dict(runs), {chat_id: list(range(50)) for chat_id in range(5)})
+
+    def test_full_chat_queue_drops_new_tasks(self):
+        scheduler = ChatScheduler(workers=1, max_chats=8, max_pending=1)
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+
+        scheduler.start()
+        self.addCleanup(scheduler.stop, 5)
+        self.addCleanup(release.set)
+        self.assertTrue(scheduler.submit(1, block))
+        started.wait(5)
+        self.assertTrue(scheduler.submit(1, lambda: None))
+        self.assertFalse(scheduler.submit(1, lambda: None))
+        self.assertTrue(scheduler.submit(2, lambda: None))
+        self.assertEqual(scheduler.dropped, 1)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        self.flights = SingleFlight(MemoryStateStore(), ttl=60, timeout=5, lease=1, poll_interval=0.01)
+
+    def test_callers_during_a_call_share_its_result(self):
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def leader_call():
+            calls.append("leader")
+            started.set()
+            release.wait(5)
+            return 42
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(self.flights.do(("chat", 1), leader_call)))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(
+            target=lambda: results.append(self.flights.do(("chat", 1), lambda: calls.append("follower")))
+        )
+        follower.start()
+        release.set()
+        leader.join(5)
+        follower.join(5)
+
+        self.assertEqual(calls, ["leader"])
+        self.assertCountEqual(results, [(42, False), (42, True)])
+        self.assertEqual(self.flights.do(("chat", 1), lambda: 0), (42, True))
+
+    def test_failed_call_is_run_again(self):
+        def fail():
+            raise ValueError("failed")
+
+        with self.assertRaises(ValueError):
+            self.flights.do(("chat", 1), fail)
+        self.assertEqual(self.flights.do(("chat", 1), lambda: 7), (7, False))
+
+
+class UpdateDeduplicatorTests(SimpleTestCase):
+    def setUp(self):
+        self.deduplicator = UpdateDeduplicator(MemoryStateStore(), ttl=60, processing_ttl=60)
+
+    def test_update_is_claimed_once(self):
+        self.assertTrue(self.deduplicator.claim(1))
+        self.assertFalse(self.deduplicator.claim(1))
+        self.deduplicator.done(1)
+        self.assertFalse(self.deduplicator.claim(1))
+
+    def test_released_update_can_be_processed_again(self):
+        self.assertTrue(self.deduplicator.claim(1))
+        self.deduplicator.release(1)
+        self.assertTrue(self.deduplicator.claim(1))
+
+
+class QuotaTests(TestCase):
+    def test_consume_takes_attempts_up_to_the_limit(self):
+        UserLimit.objects.create(phone_number="+998 90 123-45-67", limit=2)
+
+        self.assertTrue(quota.consume("998901234567"))
+        self.assertTrue(quota.consume("+998901234567"))
+        self.assertFalse(quota.consume("+998901234567"))
+        self.assertEqual(UserLimit.objects.get().used, 2)
+
+    def test_unknown_number_is_denied(self):
+        self.assertFalse(quota.consume("+10000000000"))
+
+    def test_raised_limit_clears_the_denial(self):
+        limit = UserLimit.objects.create(phone_number="+998901234568", limit=0)
+        self.assertFalse(quota.consume("+998901234568"))
+
+        limit.limit = 1
+        limit.save()
+        self.assertTrue(quota.consume("+998901234568"))
+
+
+class QuestionBankTests(TestCase):
+    def setUp(self):
+        user = TelegramUser.objects.create(user_id=1)
+        process = FlowProcess.objects.create(
+            telegram_user=user, full_name="Test", phone_number="+70000000000", birth_date="2000-01-01", gender="male"
+        )
+        self.specializations = [Specialization.objects.create(name=name) for name in ("a", "b")]
+        process.specialization.set(self.specializations[:1])
+
+    def test_refill_keys_come_from_the_window(self):
+        QuestionBankEntry.objects.create(question_type="professional_test", specialization_key="99", questions=["q"])
+        self.assertEqual(question_bank.get_refill_keys(), {
+            ("iq_test", ""), ("soft_skill", ""), ("professional_test", str(self.specializations[0].id)),
+        })
+
+    def test_stale_keys_are_evicted(self):
+        fresh = str(self.specializations[0].id)
+        for question_type, key in [("iq_test", ""), ("professional_test", fresh), ("professional_test", "99")]:
+            QuestionBankEntry.objects.create(question_type=question_type, specialization_key=key, questions=["q"])
+        self.assertEqual(question_bank.evict_stale(question_bank.get_refill_keys()), 1)
+        self.assertEqual(
+            set(QuestionBankEntry.objects.values_list("question_type", "specialization_key")),
+            {("iq_test", ""), ("professional_test", fresh)},
+        )
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.control = LLMControl(6000, 10 ** 6, 2, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0))
+        self.control.breaker.record_failure()
+
+    async def answer(self):
+        return "ok"
+
+    def test_half_open_lets_one_trial_through(self):
+        async def run():
+            release = asyncio.Event()
+
+            async def trial():
+                await release.wait()
+                return "trial"
+
+            task = asyncio.ensure_future(self.control.call(trial))
+            await asyncio.sleep(0)
+            with self.assertRaises(LLMUnavailable):
+                await self.control.call(self.answer)
+            release.set()
+            self.assertEqual(await task, "trial")
+            self.assertEqual(self.control.breaker.state, "closed")
+
+        asyncio.run(run())
+
+    def test_cancelled_trial_is_released(self):
+        async def run():
+            task = asyncio.ensure_future(self.control.call(asyncio.sleep, 10))
+            await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertFalse(self.control.breaker.trial_in_flight)
+            self.assertEqual(self.control.in_flight, 0)
+            self.assertEqual(await self.control.call(self.answer), "ok")
+
+        asyncio.run(run())
+
+    def test_trial_cancelled_while_queued_is_released(self):
+        async def run():
+            await self.control.semaphore.acquire()
+            await self.control.semaphore.acquire()
+            task = asyncio.ensure_future(self.control.call(self.answer))
+            await asyncio.sleep(0)
+            self.assertEqual(self.control.queued, 1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertFalse(self.control.breaker.trial_in_flight)
+            self.assertEqual(self.control.queued, 0)
+
+        asyncio.run(run())
+
+
+class CVIngestorTests(SimpleTestCase):
+    def setUp(self):
+        source, media = tempfile.TemporaryDirectory(), tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        self.addCleanup(media.cleanup)
+        self.source = source.name
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.ingestor = CVIngestor(LocalFileSource(self.source), max_size=1024, chunk_size=16, retries=1)
+
+    def add_file(self, name, content):
+        with open(os.path.join(self.source, name), "wb") as f:
+            f.write(content)
+
+    def test_copy_is_stored_under_its_checksum(self):
+        content = b"curriculum vitae " * 10
+        self.add_file("cv.PDF", content)
+        sha256 = hashlib.sha256(content).hexdigest()
+
+        fields = asyncio.run(self.ingestor.copy("cv.PDF"))
+
+        self.assertEqual(fields, {"cv_file": f"media/cv/{sha256}.pdf", "cv_sha256": sha256})
+        with default_storage.open(fields["cv_file"]) as f:
+            self.assertEqual(f.read(), content)
+
+    def test_same_content_is_stored_once(self):
+        self.add_file("first.pdf", b"same")
+        self.add_file("second.pdf", b"same")
+
+        first = asyncio.run(self.ingestor.copy("first.pdf"))
+        second = asyncio.run(self.ingestor.copy("second.pdf"))
+
+        self.assertEqual(first, second)
+        self.assertEqual(default_storage.listdir("media/cv")[1], [os.path.basename(first["cv_file"])])
+
+    def test_file_over_the_size_cap_is_not_stored(self):
+        self.add_file("large.pdf", b"x" * 1025)
+
+        fields = asyncio.run(self.ingestor.copy("large.pdf"))
+
+        self.assertIn("larger than 1024 bytes", fields["cv_error"])
+        self.assertFalse(default_storage.exists("media/cv"))
+
+    def test_missing_file_is_given_up(self):
+        self.assertIn("FileNotFoundError", asyncio.run(self.ingestor.copy("missing.pdf"))["cv_error"])
+
+
+@override_settings(TELEGRAM_WEBHOOK_SECRET="secret")
+class TelegramWebhookTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(webhook, "enqueue_update")
+        self.enqueue_update = patcher.start()
+        self.addCleanup(patcher.stop)
+        enabled = mock.patch.object(webhook, "enabled", True)
+        enabled.start()
+        self.addCleanup(enabled.stop)
+
+    def post(self, payload, secret=None):
+        headers = {} if secret is None else {"HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN": secret}
+        return self.client.post("/telegram/webhook/", payload, content_type="application/json", **headers)
+
+    def test_update_with_the_secret_is_enqueued(self):
+        response = self.post({"update_id": 1}, secret="secret")
+        self.assertEqual(response.status_code, 200)
+        self.enqueue_update.assert_called_once_with({"update_id": 1})
+
+    def test_missing_or_wrong_secret_is_rejected(self):
+        self.assertEqual(self.post({"update_id": 1}).status_code, 403)
+        self.assertEqual(self.post({"update_id": 1}, secret="wrong").status_code, 403)
+        self.enqueue_update.assert_not_called()
+
+    def test_body_without_update_id_is_rejected(self):
+        response = self.post({"message": {}}, secret="secret")
+        self.assertEqual(response.status_code, 400)
+
+    def test_process_not_serving_the_webhook_refuses_updates(self):
+        with mock.patch.object(webhook, "enabled", False):
+            response = self.post({"update_id": 1}, secret="secret")
+        self.assertEqual(response.status_code, 503)
+        self.enqueue_update.assert_not_called()
+
+
+class ResendResumeTests(TestCase):
+    def test_failed_sends_are_counted(self):
+        for user_id in (1, 2):
+            FlowProcess.objects.create(
+                telegram_user=TelegramUser.objects.create(user_id=user_id), full_name="Test",
+                phone_number="+70000000000", birth_date="2000-01-01", gender="male",
+                generated_resume=f"media/generated_resume/{user_id}.pdf",
+            )
+        model_admin = admin.FlowProcessAdmin(FlowProcess, django_admin.site)
+        delivery = mock.Mock()
+        delivery.send.side_effect = [Unauthorized("bot was blocked by the user"), None]
+        with mock.patch.object(admin, "get_standalone_delivery", return_value=delivery), \
+                mock.patch.object(model_admin, "message_user") as message_user:
+            model_admin.resend_resume(None, FlowProcess.objects.order_by("id"))
+        self.assertEqual(delivery.send.call_count, 2)
+        self.assertEqual(message_user.call_args.args[1], "Sent 1 resumes, 1 failed")
+
+
+class RenderResumeTests(TestCase):
+    def test_render_time_is_returned_from_the_worker(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        process = FlowProcess.objects.create(
+            telegram_user=TelegramUser.objects.create(user_id=1), full_name="Test", phone_number="+70000000000",
+            birth_date="2000-01-01", gender="male", iq_test_score=100, resume_file_id="old",
+        )
+
+        def render(context):
+            time.sleep(0.05)
+            return b"%PDF-1.7"
+
+        with override_settings(MEDIA_ROOT=media.name), mock.patch.object(resume.renderer, "render", render):
+            seconds = resume_jobs.render_resume(process.id)
+        self.assertGreaterEqual(seconds, 0.05)
+        process.refresh_from_db()
+        self.assertTrue(process.generated_resume.name.endswith(".pdf"))
+        self.assertIsNone(process.resume_file_id)
+
+    def test_pool_observes_the_worker_render_time(self):
+        pool = resume_jobs.ResumeRenderPool(on_done=None, on_failed=None)
+        future = concurrent.futures.Future()
+        future.set_result(1.5)
+        rendered = metrics.resume_render_seconds._sum.get()
+        with mock.patch.object(pool, "submit", return_value=future):
+            asyncio.run(pool.render(mock.Mock()))
+        self.assertEqual(metrics.resume_render_seconds._sum.get() - rendered, 1.5)
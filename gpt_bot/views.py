@@ -1,3 +1,46 @@
-from django.shortcuts import render
+import ipaddress
+import json
 
-# Create your views here.
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from gpt_bot.bot import webhook
+
+
+@csrf_exempt
+@require_POST
+def telegram_webhook(request):
+    if not webhook.enabled:
+        return HttpResponse("the webhook is served by `run_bot --webhook`", status=503)
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not settings.TELEGRAM_WEBHOOK_SECRET or not constant_time_compare(secret, settings.TELEGRAM_WEBHOOK_SECRET):
+        return HttpResponseForbidden()
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return HttpResponseBadRequest()
+    if not isinstance(payload, dict) or "update_id" not in payload:
+        return HttpResponseBadRequest()
+
+    webhook.enqueue_update(payload)
+    return HttpResponse()
+
+
+def is_metrics_client(request) -> bool:
+    # REMOTE_ADDR, so a proxy in front of the app must not forward /metrics from outside
+    try:
+        address = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network) for network in settings.METRICS_ALLOWED_NETWORKS)
+
+
+@require_GET
+def metrics(request):
+    if not is_metrics_client(request):
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(), content_type=CONTENT_TYPE_LATEST)
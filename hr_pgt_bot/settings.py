@@ -134,7 +134,101 @@ STATIC_ROOT = "static"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 BOT_TOKEN = env.str("BOT_TOKEN")
+# Bot API server, e.g. the `fake_bot_api` load test server at http://127.0.0.1:8081
+TELEGRAM_API_URL = env.str("TELEGRAM_API_URL", "https://api.telegram.org")
+# Prometheus exporter of a polling / ingest / shard bot process, 0 disables it
+BOT_METRICS_PORT = env.int("BOT_METRICS_PORT", 9108)
+# client addresses or networks allowed to scrape the /metrics route of the web app
+METRICS_ALLOWED_NETWORKS = env.list("METRICS_ALLOWED_NETWORKS", default=["127.0.0.1/32", "::1/128"])
+# updates run concurrently across chats and in order within a chat on BOT_DISPATCH_WORKERS threads;
+# a new chat waits while BOT_DISPATCH_MAX_CHATS have pending updates, a chat's updates past
+# BOT_DISPATCH_MAX_PENDING are dropped
+BOT_DISPATCH_WORKERS = env.int("BOT_DISPATCH_WORKERS", 8)
+BOT_DISPATCH_MAX_CHATS = env.int("BOT_DISPATCH_MAX_CHATS", 64)
+BOT_DISPATCH_MAX_PENDING = env.int("BOT_DISPATCH_MAX_PENDING", 20)
+# update ids are remembered this long to drop Telegram redeliveries, and claimed for
+# UPDATE_DEDUP_PROCESSING_TTL while being processed; a repeated expensive step
+# (saving the profile, finishing a test) reuses the first result for SINGLE_FLIGHT_TTL seconds
+UPDATE_DEDUP_TTL = env.int("UPDATE_DEDUP_TTL", 60 * 60)
+UPDATE_DEDUP_PROCESSING_TTL = env.int("UPDATE_DEDUP_PROCESSING_TTL", 120)
+SINGLE_FLIGHT_TTL = env.int("SINGLE_FLIGHT_TTL", 60)
+SINGLE_FLIGHT_TIMEOUT = env.int("SINGLE_FLIGHT_TIMEOUT", 120)
+# public https url of the telegram/webhook/ route, used by `run_bot --webhook`
+TELEGRAM_WEBHOOK_URL = env.str("TELEGRAM_WEBHOOK_URL", "")
+TELEGRAM_WEBHOOK_SECRET = env.str("TELEGRAM_WEBHOOK_SECRET", "")
+TELEGRAM_WEBHOOK_MAX_CONNECTIONS = env.int("TELEGRAM_WEBHOOK_MAX_CONNECTIONS", 40)
+# conversation state store shared by bot workers and the admin: memory:// (per process) or redis://;
+# admin changes of reference data and user limits reach the bot through it
+CONV_STATE_URL = env.str("CONV_STATE_URL", "memory://")
+CONV_STATE_TTL = env.int("CONV_STATE_TTL", 60 * 60 * 24)
+USER_REGISTRY_SIZE = env.int("USER_REGISTRY_SIZE", 100000)
+USER_REGISTRY_FLUSH_INTERVAL = env.float("USER_REGISTRY_FLUSH_INTERVAL", 5)
+# regions / specializations keyboards cache; admin changes are picked up through the state store
+REFERENCE_DATA_CHECK_INTERVAL = env.float("REFERENCE_DATA_CHECK_INTERVAL", 30)
+REFERENCE_DATA_MAX_AGE = env.float("REFERENCE_DATA_MAX_AGE", 60 * 10)
+# sharded runtime (`run_bot --ingest` + `run_bot --shard N`): memory://, sqlite:///path/to/file or redis://
+BOT_SHARDS = env.int("BOT_SHARDS", 1)
+SHARD_QUEUE_URL = env.str("SHARD_QUEUE_URL", f"sqlite:///{BASE_DIR / 'shard_queue.sqlite3'}")
 OPENAI_API_KEY = env.str("OPENAI_API_KEY")
+OPENAI_API_BASE = env.str("OPENAI_API_BASE", "https://api.openai.com/v1")
+OPENAI_TIMEOUT = env.float("OPENAI_TIMEOUT", 60)
+OPENAI_CONNECT_TIMEOUT = env.float("OPENAI_CONNECT_TIMEOUT", 10)
+OPENAI_POOL_SIZE = env.int("OPENAI_POOL_SIZE", 100)
+LLM_ANALYSIS_CONCURRENCY = env.int("LLM_ANALYSIS_CONCURRENCY", 5)
+# "parallel" - one prompt per result field, "structured" - single JSON prompt with per-field fallback
+LLM_ANALYSIS_MODE = env.str("LLM_ANALYSIS_MODE", "parallel")
+# provider limits shared by every model call of the process
+LLM_REQUESTS_PER_MINUTE = env.int("LLM_REQUESTS_PER_MINUTE", 3000)
+LLM_TOKENS_PER_MINUTE = env.int("LLM_TOKENS_PER_MINUTE", 250000)
+LLM_MAX_CONCURRENCY = env.int("LLM_MAX_CONCURRENCY", 50)
+LLM_MAX_RETRIES = env.int("LLM_MAX_RETRIES", 4)
+LLM_BACKOFF_BASE = env.float("LLM_BACKOFF_BASE", 1)
+LLM_BACKOFF_MAX = env.float("LLM_BACKOFF_MAX", 30)
+LLM_BREAKER_FAILURES = env.int("LLM_BREAKER_FAILURES", 5)
+LLM_BREAKER_RESET_TIMEOUT = env.float("LLM_BREAKER_RESET_TIMEOUT", 30)
+# per call site profiles live in gpt_bot/bot/prompts.py
+LLM_DEFAULT_MODEL = env.str("LLM_DEFAULT_MODEL", "text-davinci-003")
+LLM_FAST_MODEL = env.str("LLM_FAST_MODEL", "gpt-3.5-turbo-instruct")
+LLM_ROUTER_PROBE_EVERY = env.int("LLM_ROUTER_PROBE_EVERY", 10)
+# a call is cut off after its latency budget plus max_tokens at this generation rate
+LLM_ROUTER_TOKENS_PER_SECOND = env.float("LLM_ROUTER_TOKENS_PER_SECOND", 100)
+# response cache for the call sites that opt in: memory://, sqlite:///path or redis://
+LLM_CACHE_ENABLED = env.bool("LLM_CACHE_ENABLED", True)
+LLM_CACHE_URL = env.str("LLM_CACHE_URL", "memory://")
+LLM_CACHE_TTL = env.int("LLM_CACHE_TTL", 60 * 60 * 24)
+LLM_CACHE_MAX_ENTRIES = env.int("LLM_CACHE_MAX_ENTRIES", 10000)
+
+QUESTION_BANK_LOW_WATERMARK = env.int("QUESTION_BANK_LOW_WATERMARK", 5)
+QUESTION_BANK_TARGET_SIZE = env.int("QUESTION_BANK_TARGET_SIZE", 20)
+QUESTION_BANK_MAX_USES = env.int("QUESTION_BANK_MAX_USES", 50)
+QUESTION_BANK_MAX_AGE_DAYS = env.int("QUESTION_BANK_MAX_AGE_DAYS", 30)
+QUESTION_BANK_KEY_WINDOW_DAYS = env.int("QUESTION_BANK_KEY_WINDOW_DAYS", 14)
+QUESTION_BANK_REFILL_INTERVAL = env.int("QUESTION_BANK_REFILL_INTERVAL", 60 * 10)
+
+# send the first generated question as soon as it is parsed from the streamed completion
+LLM_STREAM_QUESTIONS = env.bool("LLM_STREAM_QUESTIONS", True)
+QUESTION_STREAM_WAIT_TIMEOUT = env.float("QUESTION_STREAM_WAIT_TIMEOUT", 60)
+
+PREFETCH_TTL = env.int("PREFETCH_TTL", 60 * 60 * 24)
+PREFETCH_WAIT_TIMEOUT = env.float("PREFETCH_WAIT_TIMEOUT", 90)
+CONVERSATION_TIMEOUT = env.int("CONVERSATION_TIMEOUT", 60 * 60 * 6)
+# phone numbers without test attempts left are answered from the cache for this long
+USER_LIMIT_DENIED_TTL = env.int("USER_LIMIT_DENIED_TTL", 60)
+
+# CVs are copied to the media storage in the background; telegram:// downloads through the bot,
+# file:///path/to/dir reads file ids as file names from a local directory (tests)
+CV_SOURCE_URL = env.str("CV_SOURCE_URL", "telegram://")
+CV_MAX_SIZE = env.int("CV_MAX_SIZE", 20 * 1024 * 1024)
+CV_INGEST_CONCURRENCY = env.int("CV_INGEST_CONCURRENCY", 4)
+CV_INGEST_RETRIES = env.int("CV_INGEST_RETRIES", 3)
+RESUME_RENDER_WORKERS = env.int("RESUME_RENDER_WORKERS", 2)
+# resume jobs a bot process analyses or renders at once; the analysis runs on the shared LLM client
+RESUME_JOB_CONCURRENCY = env.int("RESUME_JOB_CONCURRENCY", 20)
+RESUME_JOB_POLL_INTERVAL = env.float("RESUME_JOB_POLL_INTERVAL", 1)
+RESUME_JOB_MAX_ATTEMPTS = env.int("RESUME_JOB_MAX_ATTEMPTS", 3)
+RESUME_JOB_RETRY_DELAY = env.int("RESUME_JOB_RETRY_DELAY", 10)
+# a running job not renewed for this long belongs to a dead bot process and is rendered again
+RESUME_JOB_LEASE = env.int("RESUME_JOB_LEASE", 300)
 CSRF_TRUSTED_ORIGINS = ["https://2500-84-54-75-158.ngrok-free.app"]
 # CACHES = {
 #     "default": {
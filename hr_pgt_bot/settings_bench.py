@@ -0,0 +1,27 @@
+"""
+Local profile for `manage.py bench`: SQLite file database, in-process state
+store and caches, no Postgres, Redis or real tokens needed.
+
+    DJANGO_SETTINGS_MODULE=hr_pgt_bot.settings_bench python manage.py bench
+"""
+import os
+import tempfile
+
+for name in ("POSTGRES_DB", "POSTGRES_USER", "POSTGRES_PASSWORD", "POSTGRES_HOST", "POSTGRES_PORT"):
+    os.environ.setdefault(name, "")
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from .settings import *  # noqa: E402,F401,F403
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "bench.sqlite3",
+    }
+}
+CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+MEDIA_ROOT = tempfile.mkdtemp(prefix="bench_media_")
+CONV_STATE_URL = "memory://"
+LLM_CACHE_URL = "memory://"
+SHARD_QUEUE_URL = "memory://"
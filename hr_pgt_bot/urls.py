@@ -18,9 +18,13 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path
 
+from gpt_bot import views
+
 
 urlpatterns = [
-    path("admin/", admin.site.urls)
+    path("admin/", admin.site.urls),
+    path("telegram/webhook/", views.telegram_webhook, name="telegram-webhook"),
+    path("metrics", views.metrics, name="metrics"),
 ]
 
 if settings.DEBUG: